@@ -0,0 +1,281 @@
+import contextlib
+import dbconnect
+import metrics
+import re
+import storage
+import weakref
+
+# This module holds every query on the animal table, so the handlers in app.py never build SQL themselves
+# The functions take a borrowed connection and leave committing to write_transaction, so several of them can share one transaction
+# Rows are returned as the plain (name, id) tuples that come from the cursor instead of being copied into dictionaries
+
+select_animal_sql = "SELECT name, id FROM animal WHERE id = ?"
+insert_animal_sql = "INSERT INTO animal(name) VALUES(?)"
+update_animal_sql = "UPDATE animal SET name = ? WHERE id = ?"
+delete_animal_sql = "DELETE FROM animal WHERE id = ?"
+
+# The statements of the change log added by migrations/002_animal_change_log.sql
+reserve_change_versions_sql = "UPDATE animal_change_version SET version = version + ? WHERE id = 1"
+select_change_version_sql = "SELECT version FROM animal_change_version WHERE id = 1"
+insert_change_sql = "INSERT INTO animal_change(version, operation, animal_id, name) VALUES(?, ?, ?, ?)"
+select_changes_sql = "SELECT version, operation, animal_id, name FROM animal_change WHERE version > ? ORDER BY version LIMIT ?"
+
+# The conditions used by each kind of search come from the storage backend, since the full-text search and the LIKE escaping differ between databases
+search_conditions = storage.backend.search_conditions
+
+# The words that make up a full-text search, ignoring any full-text operators the client sent
+search_word_pattern = re.compile(r"[A-Za-z0-9]+")
+
+# The prepared statement cursors of each pooled connection, keyed by their SQL
+# Reusing the same cursor for the same statement lets the server parse and plan the statement once per connection instead of once per request
+# Each cursor holds its connection, so the weak keys alone would never let go of it, and the cursors are closed and forgotten by forget_connection when the pool closes the connection
+statement_cursors = weakref.WeakKeyDictionary()
+
+# The changes made by the open write transaction of each connection, which are added to the change log when it commits
+pending_changes = weakref.WeakKeyDictionary()
+
+# Creating a function that returns the prepared cursor for a statement on a connection, preparing it the first time it is used
+def get_statement_cursor(conn, sql):
+    cursors = statement_cursors.get(conn)
+    if(cursors == None):
+        cursors = statement_cursors[conn] = {}
+    cursor = cursors.get(sql)
+    if(cursor == None):
+        cursor = cursors[sql] = dbconnect.create_statement_cursor(conn)
+    return cursor
+
+# Creating a function that closes and forgets the prepared cursor of a statement, for example after it failed
+def forget_statement_cursor(conn, sql):
+    cursors = statement_cursors.get(conn)
+    if(cursors == None or sql not in cursors):
+        return
+    try:
+        cursors.pop(sql).close()
+    except Exception:
+        pass
+
+# Creating a function that closes and forgets every prepared cursor and pending change of a connection that the pool is closing
+def forget_connection(conn):
+    pending_changes.pop(conn, None)
+    cursors = statement_cursors.pop(conn, None)
+    if(cursors == None):
+        return
+    for cursor in cursors.values():
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+# Letting go of the cursors of every connection the pools close
+dbconnect.connection_close_hooks.append(forget_connection)
+
+# Creating a function that runs a prepared statement and returns its cursor so the caller can read the rows or row count
+def execute_statement(conn, sql, params, is_many=False):
+    cursor = get_statement_cursor(conn, sql)
+    try:
+        with metrics.timed_phase("execute"):
+            if(is_many):
+                cursor.executemany(sql, params)
+            else:
+                cursor.execute(sql, params)
+    except Exception as error:
+        # A failed statement may leave its cursor unusable, so the next call prepares a new one
+        forget_statement_cursor(conn, sql)
+        dbconnect.report_query_error(conn, error)
+        raise
+    return cursor
+
+# Creating a function that runs a query whose SQL changes with the number of values, such as an IN list, on a short-lived cursor
+def fetch_dynamic_query(conn, sql, params):
+    with metrics.timed_phase("cursor"):
+        cursor = conn.cursor()
+    try:
+        with metrics.timed_phase("execute"):
+            cursor.execute(sql, params)
+        with metrics.timed_phase("fetch"):
+            return cursor.fetchall()
+    except Exception as error:
+        dbconnect.report_query_error(conn, error)
+        raise
+    finally:
+        cursor.close()
+
+# Creating a function that returns a comma-separated list of placeholders for an IN clause
+def make_placeholders(count):
+    return ", ".join(["?"] * count)
+
+# Creating a function that turns a name prefix into a LIKE pattern, escaping the characters that LIKE treats as wildcards
+def make_prefix_pattern(prefix):
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+# Creating a function that turns a search into the backend's full-text query where every word must match the start of a word in the name, returning None if it has no words
+def make_fulltext_query(search_text):
+    words = search_word_pattern.findall(search_text)
+    if(len(words) == 0):
+        return None
+    return storage.backend.make_fulltext_query(words)
+
+# Creating a function that reads the search arguments of GET /animals, returning None if there is no search and raising a ValueError if the search is invalid
+# The search is returned as a (kind, value) pair where the value has already been prepared for that kind, ready for build_select_animals_query
+def parse_search_args(args):
+    searches = [(kind, args[kind]) for kind in ("name", "prefix", "q") if kind in args]
+    if(len(searches) == 0):
+        return None
+    if(len(searches) > 1):
+        raise ValueError("Only one of name, prefix or q can be used at a time.")
+    kind, value = searches[0]
+    if(value == ""):
+        raise ValueError(f"The {kind} search must not be empty.")
+    # Turning the search into the value the query expects
+    if(kind == "prefix"):
+        return kind, make_prefix_pattern(value)
+    if(kind == "q"):
+        fulltext_query = make_fulltext_query(value)
+        if(fulltext_query == None):
+            raise ValueError("The q search must contain at least one letter or number.")
+        return kind, fulltext_query
+    return kind, value
+
+# Creating a function that builds the query and parameters for a page of animals ordered by id, optionally filtered by a search
+# The search is either None or a (kind, value) pair where the kind is "name", "prefix" or "q" and the value has already been prepared for that kind
+# Only a handful of different SQL strings come out of this function, so each of them is prepared once per connection
+def build_select_animals_query(after_id, limit, search=None):
+    conditions = ["id > ?"]
+    params = [after_id]
+    if(search != None):
+        kind, value = search
+        conditions = [search_conditions[kind], storage.backend.search_after_id_condition]
+        params.insert(0, value)
+    sql = "SELECT name, id FROM animal WHERE " + " AND ".join(conditions) + " ORDER BY id"
+    if(limit != None):
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+# Creating a function that returns a page of animals ordered by id, starting right after the given id
+def select_animals(conn, after_id, limit=None, search=None):
+    sql, params = build_select_animals_query(after_id, limit, search)
+    cursor = execute_statement(conn, sql, params)
+    with metrics.timed_phase("fetch"):
+        return cursor.fetchall()
+
+# Creating a function that returns one animal as a (name, id) tuple, or None if it doesn't exist
+def select_animal(conn, animal_id):
+    cursor = execute_statement(conn, select_animal_sql, [animal_id,])
+    with metrics.timed_phase("fetch"):
+        return cursor.fetchone()
+
+# Creating a generator that yields the animals in batches as they are read from the cursor, so the whole table is never held in memory
+# It uses its own unbuffered cursor because the rows are read while the caller is still sending earlier batches
+def stream_animals(conn, after_id, limit, batch_size, search=None):
+    sql, params = build_select_animals_query(after_id, limit, search)
+    cursor = dbconnect.create_streaming_cursor(conn)
+    try:
+        with metrics.timed_phase("execute"):
+            cursor.execute(sql, params)
+        while True:
+            with metrics.timed_phase("fetch"):
+                rows = cursor.fetchmany(batch_size)
+            if(len(rows) == 0):
+                return
+            yield rows
+    except Exception as error:
+        dbconnect.report_query_error(conn, error)
+        raise
+    finally:
+        cursor.close()
+
+# Creating a context manager for a transaction that writes animals, which adds the changes of its writes to the change log and commits when the block ends
+# If the block raises an error nothing is committed, and the connection is rolled back when it goes back to the pool
+@contextlib.contextmanager
+def write_transaction(conn):
+    changes = pending_changes[conn] = []
+    try:
+        yield
+        # Adding the change log rows last so that the lock on the version counter is only held for the commit
+        record_changes(conn, changes)
+        with metrics.timed_phase("commit"):
+            conn.commit()
+    finally:
+        pending_changes.pop(conn, None)
+
+# Creating a function that remembers a change made in the connection's write transaction, as an (operation, animal id, name) tuple
+def add_change(conn, operation, animal_id, animal_name=None):
+    pending_changes[conn].append((operation, animal_id, animal_name))
+
+# Creating a function that adds changes to the change log with the next version numbers, returning the last version or None if there were no changes
+def record_changes(conn, changes):
+    if(len(changes) == 0):
+        return None
+    execute_statement(conn, reserve_change_versions_sql, [len(changes),])
+    last_version = execute_statement(conn, select_change_version_sql, []).fetchone()[0]
+    first_version = last_version - len(changes) + 1
+    execute_statement(conn, insert_change_sql, [[first_version + index, operation, animal_id, animal_name] for index, (operation, animal_id, animal_name) in enumerate(changes)], is_many=True)
+    return last_version
+
+# Creating a function that returns the version of the latest change, which clients start following the change log from
+def select_change_version(conn):
+    cursor = execute_statement(conn, select_change_version_sql, [])
+    with metrics.timed_phase("fetch"):
+        return cursor.fetchone()[0]
+
+# Creating a function that returns up to limit changes made after the given version as (version, operation, animal id, name) tuples, oldest first
+def select_changes(conn, since_version, limit):
+    cursor = execute_statement(conn, select_changes_sql, [since_version, limit])
+    with metrics.timed_phase("fetch"):
+        return cursor.fetchall()
+
+# Creating a function that inserts an animal and returns the row count and the new animal's id
+def insert_animal(conn, animal_name):
+    cursor = execute_statement(conn, insert_animal_sql, [animal_name,])
+    row_count, new_id = cursor.rowcount, cursor.lastrowid
+    add_change(conn, "create", new_id, animal_name)
+    return row_count, new_id
+
+# Creating a function that renames an animal and returns the row count
+def update_animal(conn, animal_id, animal_name):
+    row_count = execute_statement(conn, update_animal_sql, [animal_name, animal_id]).rowcount
+    if(row_count > 0):
+        add_change(conn, "update", animal_id, animal_name)
+    return row_count
+
+# Creating a function that deletes an animal and returns the row count
+def delete_animal(conn, animal_id):
+    row_count = execute_statement(conn, delete_animal_sql, [animal_id,]).rowcount
+    if(row_count > 0):
+        add_change(conn, "delete", animal_id)
+    return row_count
+
+# Creating a function that inserts many animals with one executemany call and returns the (name, id) pairs of the new animals
+def insert_animals(conn, animal_names):
+    execute_statement(conn, insert_animal_sql, [[animal_name,] for animal_name in animal_names], is_many=True)
+    # Getting the ids of the new animals by their unique names
+    new_animals = select_animals_by_names(conn, animal_names)
+    for animal_name, new_id in new_animals:
+        add_change(conn, "create", new_id, animal_name)
+    return new_animals
+
+# Creating a function that renames many animals with one executemany call, taking a list of [name, id] pairs of animals that exist
+def update_animals(conn, names_and_ids):
+    execute_statement(conn, update_animal_sql, names_and_ids, is_many=True)
+    for animal_name, animal_id in names_and_ids:
+        add_change(conn, "update", animal_id, animal_name)
+
+# Creating a function that deletes many animals with one executemany call, taking a list of ids of animals that exist
+def delete_animals(conn, animal_ids):
+    execute_statement(conn, delete_animal_sql, [[animal_id,] for animal_id in animal_ids], is_many=True)
+    for animal_id in animal_ids:
+        add_change(conn, "delete", animal_id)
+
+# Creating a function that returns the (name, id) pairs of the animals that have one of the given names
+def select_animals_by_names(conn, animal_names):
+    if(len(animal_names) == 0):
+        return []
+    return fetch_dynamic_query(conn, f"SELECT name, id FROM animal WHERE name IN ({make_placeholders(len(animal_names))})", list(animal_names))
+
+# Creating a function that returns which of the given ids belong to existing animals
+def select_existing_ids(conn, animal_ids):
+    if(len(animal_ids) == 0):
+        return set()
+    rows = fetch_dynamic_query(conn, f"SELECT id FROM animal WHERE id IN ({make_placeholders(len(animal_ids))})", list(animal_ids))
+    return set(row[0] for row in rows)
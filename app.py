@@ -1,100 +1,429 @@
+import animaldb
+import cache
+import changefeed
 import dbconnect
-import mariadb
-from flask import Flask, request, Response
-import json
+import group_commit
+import math
+import metrics
+from flask import Flask, g, request, Response
 import re
+import serializer
+import settings
+import storage
+import time
 import traceback
-
-# Creating a function that searches for invalid characters in the animal's name
-def check_invalid_chars(user_input):
-    # Using the python's regular expression compile and search methods to find whether the user's data contains invalid characters for the animal name
-    valid_chars = re.compile(r'[a-zA-Z]').search(user_input)
-    # If the animal name contains only lowercase and uppercase letters, store it in the database
-    if(valid_chars):
-        return True
-    # if the animal name is contains invalid characters such as numbers or special characters, don't store it in the database
-    else:
-        return False
-
-# Creating a function that closes the database connection and the cursor
-def close_db_connection_and_cursor(conn, cursor):
-    # Closing the cursor and database connection
-    closing_cursor = dbconnect.close_cursor(cursor)
-    closing_db = dbconnect.close_db_connection(conn)
-    # If the cursor or database connection failed to close, print an error message
-    if(closing_cursor == False or closing_db == False):
-        print("Failed to close cursor and database connection.")
-
-# Checking to see if the database connection is opened and the cursor is created
-def check_db_connection_and_cursor(conn, cursor):
-    # If the connection was successful but the cursor was failed to be created, print an error message and attempt to close the cursor and database connection again
-    if(conn == None or cursor == None):
-        print("An error has occured in the database.")
-        dbconnect.close_cursor(cursor)
-        dbconnect.close_db_connection(conn)
-        return
+from validation import validate_name, validate_names
 
 # Initializing the flask server
 app = Flask(__name__)
 
+# Remembering when each request started so its latency can be recorded once the response is ready
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+# Recording the latency and status code of each request by route and method
+@app.after_request
+def record_request_metrics(response):
+    started_at = g.get("request_started_at")
+    if(started_at != None):
+        # Using the route pattern rather than the path so that each route has one series no matter what ids are requested
+        route = request.url_rule.rule if request.url_rule != None else "unmatched"
+        metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - started_at)
+    return response
+
+# Remembering when a client last wrote an animal, so its reads go to the primary for a few seconds and it sees its own write even if the replicas lag behind
+@app.after_request
+def remember_last_write(response):
+    if(request.method in ("POST", "PATCH", "DELETE") and response.status_code < 300 and len(settings.replica_hosts) > 0 and settings.read_your_writes_seconds > 0):
+        response.set_cookie("animals_last_write", str(time.time()), max_age=math.ceil(settings.read_your_writes_seconds), httponly=True)
+    return response
+
+# Creating a function that tells whether this request should read from the primary because the client wrote an animal a moment ago
+# Clients that don't keep cookies can send the same time in the X-Last-Write-At header instead
+def wants_primary_read():
+    last_write_at = request.headers.get("X-Last-Write-At", request.cookies.get("animals_last_write"))
+    if(last_write_at == None):
+        return False
+    try:
+        return time.time() - float(last_write_at) < settings.read_your_writes_seconds
+    except ValueError:
+        return False
+
+# Sending a 503 Service Unavailable response when no database connection could be borrowed, telling the client when to try again
+# This answers right away while the circuit breaker is open instead of making every request wait for a database that is down
+@app.errorhandler(dbconnect.DatabaseUnavailableError)
+def handle_database_unavailable(error):
+    response = Response("The database is unavailable. Please try again later.", mimetype="text/plain", status=503)
+    response.headers["Retry-After"] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+# Sending a 504 Gateway Timeout response when a write timed out after the group commit writer had started its batch
+# The batch may still commit, so the client is told to check the animal before sending the write again
+@app.errorhandler(group_commit.WriteTimeoutError)
+def handle_write_timeout(error):
+    return Response("The write timed out and may still be applied. Check the animal before sending it again.", mimetype="text/plain", status=504)
+
+# Creating a GET request to the "metrics" endpoint to export the request, database, pool and cache metrics in the Prometheus text format
+@app.get("/metrics")
+def get_metrics():
+    extra_gauges = [
+        ("animals_pool", "Connection pool statistics.", dbconnect.get_pool_stats()),
+        ("animals_cache", "GET /animals response cache statistics.", cache.get_cache_stats()),
+        ("animals_group_commit", "Group commit writer statistics.", group_commit.get_group_commit_stats()),
+        ("animals_breaker", "Database circuit breaker statistics (state 0 is closed, 1 is half-open and 2 is open).", dbconnect.get_breaker_stats()),
+        ("animals_read_routes", "Reads sent to the primary and to the read replicas.", dbconnect.get_read_route_stats()),
+        ("animals_change_feed", "Change stream statistics.", changefeed.get_change_feed_stats())
+    ]
+    # Adding the pool and breaker statistics of the read replicas, with the replica's host:port as a label so each statistic is one metric family across the replicas
+    replica_stats = dbconnect.get_replica_stats()
+    labeled_gauges = [
+        ("animals_replica_pool", "Connection pool statistics of each read replica.", ("replica",), [((name,), pool_stats) for name, pool_stats, breaker_stats in replica_stats]),
+        ("animals_replica_breaker", "Circuit breaker statistics of each read replica (state 2 means it is ejected).", ("replica",), [((name,), breaker_stats) for name, pool_stats, breaker_stats in replica_stats])
+    ]
+    return Response(metrics.render(extra_gauges, labeled_gauges), mimetype="text/plain; version=0.0.4", status=200)
+
+# Creating a function that reads the pagination arguments of GET /animals, raising a ValueError if they are invalid
+def get_page_args():
+    # The id of the last animal the client has already seen, so the next page starts right after it and the database can seek on the primary key instead of scanning with an OFFSET
+    after_id = int(request.args.get("after_id", 0))
+    # If no limit was sent, the whole table is returned as before
+    limit = request.args.get("limit")
+    if(limit != None):
+        limit = int(limit)
+        if(limit < 1 or limit > settings.page_max_limit):
+            raise ValueError(f"The limit must be between 1 and {settings.page_max_limit}.")
+    if(after_id < 0):
+        raise ValueError("The after_id must not be negative.")
+    return after_id, limit
+
+# Creating a function that reads the search arguments of GET /animals, returning None if there is no search and raising a ValueError if the search is invalid
+def get_search_arg():
+    return animaldb.parse_search_args(request.args)
+
+# Creating a generator that streams animals to the client as they come from the cursor so the whole table never has to be held in memory
+def generate_animals_stream(after_id, limit, search, is_ndjson, use_primary=False):
+    with dbconnect.pooled_read_connection(use_primary) as conn:
+        # Creating a try-except block to catch errors while the animals are being streamed
+        try:
+            batches = animaldb.stream_animals(conn, after_id, limit, settings.stream_batch_size, search)
+            # Reading the first batch before sending the opening of the response, so the caller can still send an error response if the query failed
+            first_rows = next(batches, [])
+            yield b"" if is_ndjson else b"["
+            is_first_row = True
+            for rows in prepend_chunk(first_rows, batches):
+                if(len(rows) == 0):
+                    break
+                # Sending each batch as one chunk, with one animal per line in NDJSON or comma-separated animals in a JSON array
+                with metrics.timed_phase("serialize"):
+                    if(is_ndjson):
+                        chunk = serializer.encode_ndjson_rows(rows)
+                    else:
+                        chunk = serializer.encode_rows_chunk(rows, is_first_row)
+                yield chunk
+                is_first_row = False
+            if(not is_ndjson):
+                yield b"]"
+        # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
+        except storage.backend.OperationalError:
+            print("An operational error has occured when streaming the animals from the database.")
+            traceback.print_exc()
+        # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
+        except storage.backend.DatabaseError:
+            print("Error detected in the database while streaming the animals.")
+            traceback.print_exc()
+        # Raising a general exception to catch all other errors, printing a general error message and the traceback
+        # The client disconnecting closes this generator with GeneratorExit, which is not caught here so the connection still goes back to the pool
+        except Exception:
+            print("An error has occured while streaming the animals.")
+            traceback.print_exc()
+
+# Creating a generator that sends an item that was already taken from a stream before the rest of the stream
+def prepend_chunk(first_chunk, chunks):
+    yield first_chunk
+    yield from chunks
+
+# Creating a function that builds the GET /animals response, answering with 304 Not Modified if the client already has this version of the list
+def build_animals_list_response(animals_list_json, etag, next_after_id, change_version):
+    if(cache.etag_matches(request.headers.get("If-None-Match"), etag)):
+        cache.animals_cache.record_not_modified()
+        response = Response(status=304)
+    else:
+        response = Response(animals_list_json, mimetype="application/json", status=200)
+    response.headers["ETag"] = etag
+    # Asking clients to check back with the ETag before reusing their copy, since the list changes whenever an animal is written
+    response.headers["Cache-Control"] = "no-cache"
+    # If the page is full, tell the client where the next page starts
+    if(next_after_id != None):
+        response.headers["X-Next-After-Id"] = str(next_after_id)
+    # Telling the client which change log version the list includes, so it can follow GET /animals/changes from there instead of downloading the list again
+    response.headers["X-Change-Version"] = str(change_version)
+    return response
+
 # Creating a GET request to the "animals" endpoint to get the list of animals
 @app.get("/animals")
 def get_animals_list():
-    # Opening the database and creating a cursor
-    conn = dbconnect.open_db_connection()
-    cursor = dbconnect.create_db_cursor(conn)
-
-    # Initalizing the list of animals as a variable and assigning it a value of "None" so that it can still be referenced after the try-except block
-    animals_list = None
-
-    # Checking to see if the database connection is opened and whether the cursor is created
-    check_db_connection_and_cursor(conn, cursor)
+    # Creating a try-except block to catch invalid pagination arguments
+    try:
+        after_id, limit = get_page_args()
+    except ValueError:
+        traceback.print_exc()
+        return Response(f"The after_id must be a non-negative integer and the limit must be an integer between 1 and {settings.page_max_limit}.", mimetype="text/plain", status=400)
+    # Creating a try-except block to catch invalid search arguments
+    try:
+        search = get_search_arg()
+    except ValueError as error:
+        return Response(str(error), mimetype="text/plain", status=400)
+
+    # Reading from the primary instead of a replica if the client wrote an animal a moment ago
+    use_primary = wants_primary_read()
+
+    # If the client asked for a stream, send the animals as they are read from the database instead of building the whole list first
+    if(request.args.get("stream") == "1"):
+        is_ndjson = request.args.get("format") == "ndjson"
+        chunks = generate_animals_stream(after_id, limit, search, is_ndjson, use_primary)
+        # Running the query before the response starts so a database error can still be reported with a server error response
+        first_chunk = next(chunks, None)
+        if(first_chunk == None):
+            return Response("Failed to retrieve animals from database.", mimetype="text/plain", status=500)
+        mimetype = "application/x-ndjson" if is_ndjson else "application/json"
+        return Response(prepend_chunk(first_chunk, chunks), mimetype=mimetype, status=200)
+
+    # A client that wrote a moment ago skips the cache, which may hold a page read from a replica that had not caught up with the write yet
+    cache_key = (after_id, limit, search)
+    is_cache_used = settings.cache_enabled and not use_primary
+    # Remembering the cache generation before reading so the page is not cached if an animal is written while it is being read
+    cache_generation = cache.animals_cache.current_generation()
+
+    # Borrowing a database connection from a read replica, or from the primary if there are none or the client wrote a moment ago
+    with dbconnect.pooled_read_connection(use_primary) as conn:
+        # Initalizing the list of animals and the cached page as variables and assigning them a value of "None" so that they can still be referenced after the try-except block
+        animals_list = None
+        cached_page = None
+
+        # Creating a try-except block to catch errors when getting the list of animals from the database
+        try:
+            # Reading the change log version before the animals, so a change made in between is replayed by the change feed rather than missed
+            change_version = animaldb.select_change_version(conn)
+            # If this page is in the cache and no animal was written since it was cached, answer from the cache without reading the animals
+            # The version is shared by every worker, so this one primary key lookup also catches the writes made by other workers, which only invalidate their own cache
+            if(is_cache_used):
+                cached_page = cache.animals_cache.get(cache_key, change_version)
+            # Getting the page of animals from the database
+            if(cached_page == None):
+                animals_list = animaldb.select_animals(conn, after_id, limit, search)
+        # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
+        except storage.backend.OperationalError:
+            print(f"An operational error has occured when retrieving the all the animals from the database.")
+            traceback.print_exc()
+        # Raising the ProgrammingError exception for errors made by the programmer, printing an error message and the traceback
+        except storage.backend.ProgrammingError:
+            print("Invalid SQL syntax.")
+            traceback.print_exc()
+        # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
+        except storage.backend.DatabaseError:
+            print("Error detected in the database and resulted in a connection failure.")
+            traceback.print_exc()
+        # Raising a general exception to catch all other errors, printing a general error message and the traceback
+        except:
+            print("An error has occured.")
+            traceback.print_exc()
+
+        # Returning the connection to the pool once the with block ends
+
+    # If the page was still current in the cache, send the cached response
+    if(cached_page != None):
+        (animals_list_json, next_after_id, change_version), etag = cached_page
+        return build_animals_list_response(animals_list_json, etag, next_after_id, change_version)
+    # If the list of animals was successfully retrieved from the database, convert the list of animals into JSON format and send a client success response
+    elif(animals_list != None):
+        with metrics.timed_phase("serialize"):
+            animals_list_json = serializer.encode_rows(animals_list)
+        etag = cache.make_etag(animals_list_json)
+        next_after_id = None
+        if(limit != None and len(animals_list) == limit):
+            next_after_id = animals_list[-1][1]
+        # Storing the serialized page at the version it was read at so the next request for it does not need to read the animals
+        if(settings.cache_enabled):
+            cache.animals_cache.put(cache_key, (animals_list_json, next_after_id, change_version), etag, cache_generation, change_version)
+        return build_animals_list_response(animals_list_json, etag, next_after_id, change_version)
+    # If the list of animals was not retrieved from the database, send the user a server error response
+    else:
+        return Response("Failed to retrieve animals from database.", mimetype="text/plain", status=500)
 
-    # Creating a try-except block to catch errors when getting the list of animals from the database
+# Creating a GET request to the "animals/<id>" endpoint to get one animal by its id
+@app.get("/animals/<int:animal_id>")
+def get_animal(animal_id):
+    # Initalizing the animal as a variable so that it can still be referenced after the try-except block
+    animal = None
+    is_query_successful = False
+
+    # Borrowing a database connection from a read replica, or from the primary if there are none or the client wrote a moment ago
+    with dbconnect.pooled_read_connection(wants_primary_read()) as conn:
+        # Creating a try-except block to catch errors when getting the animal from the database
+        try:
+            animal = animaldb.select_animal(conn, animal_id)
+            is_query_successful = True
+        # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
+        except storage.backend.OperationalError:
+            print("An operational error has occured when retrieving the animal from the database.")
+            traceback.print_exc()
+        # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
+        except storage.backend.DatabaseError:
+            print("Error detected in the database and resulted in a connection failure.")
+            traceback.print_exc()
+        # Raising a general exception to catch all other errors, printing a general error message and the traceback
+        except:
+            print("An error has occured.")
+            traceback.print_exc()
+
+    # If the query failed, send the user a server error response
+    if(is_query_successful == False):
+        return Response("Failed to retrieve the animal from database.", mimetype="text/plain", status=500)
+    # If there is no animal with this id, send the user a client error response
+    if(animal == None):
+        return Response(f"Animal {animal_id} does not exist.", mimetype="text/plain", status=404)
+    found_animal = {
+        'id': animal[1],
+        'name': animal[0]
+    }
+    with metrics.timed_phase("serialize"):
+        found_animal_json = serializer.dumps(found_animal)
+    return Response(found_animal_json, mimetype="application/json", status=200)
+
+# Creating a function that reads the change log version a client wants the changes after, raising a ValueError if it is missing or invalid
+# A reconnecting EventSource sends the id of the last event it received in the Last-Event-ID header, which takes the place of the since argument it first connected with
+def get_since_arg():
+    since = request.headers.get("Last-Event-ID", request.args.get("since"))
+    if(since == None):
+        raise ValueError("The since argument is required.")
+    since = int(since)
+    if(since < 0):
+        raise ValueError("The since argument must not be negative.")
+    return since
+
+# Creating a GET request to the "animals/changes" endpoint to get the creates, edits and deletes made after a change log version
+# Each change is sent as [version, operation, id, name], where the operation is "create", "update" or "delete" and the name of a delete is null
+@app.get("/animals/changes")
+def get_animal_changes():
+    # Creating a try-except block to catch invalid arguments
     try:
-        # Getting the all the animals from the database
-        cursor.execute("SELECT name, id FROM animal")
-        animals_list = cursor.fetchall()
-    # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
-    except mariadb.OperationalError:
-        print(f"An operational error has occured when retrieving the all the animals from the database.")
+        since = get_since_arg()
+        limit = int(request.args.get("limit", settings.page_max_limit))
+        if(limit < 1 or limit > settings.page_max_limit):
+            raise ValueError(f"The limit must be between 1 and {settings.page_max_limit}.")
+    except ValueError:
         traceback.print_exc()
-    # Raising the ProgrammingError exception for errors made by the programmer, printing an error message and the traceback
-    except mariadb.ProgrammingError:
-        print("Invalid SQL syntax.")
+        return Response(f"The since argument must be a non-negative integer and the limit must be an integer between 1 and {settings.page_max_limit}.", mimetype="text/plain", status=400)
+
+    # Initalizing the list of changes as a variable so that it can still be referenced after the try-except block
+    changes = None
+
+    # Borrowing a database connection from a read replica, or from the primary if there are none or the client wrote a moment ago
+    with dbconnect.pooled_read_connection(wants_primary_read()) as conn:
+        # Creating a try-except block to catch errors when getting the changes from the database
+        try:
+            changes = animaldb.select_changes(conn, since, limit)
+        # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
+        except storage.backend.OperationalError:
+            print("An operational error has occured when retrieving the animal changes from the database.")
+            traceback.print_exc()
+        # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
+        except storage.backend.DatabaseError:
+            print("Error detected in the database and resulted in a connection failure.")
+            traceback.print_exc()
+        # Raising a general exception to catch all other errors, printing a general error message and the traceback
+        except:
+            print("An error has occured.")
+            traceback.print_exc()
+
+    # If the changes were not retrieved from the database, send the user a server error response
+    if(changes == None):
+        return Response("Failed to retrieve the animal changes from database.", mimetype="text/plain", status=500)
+    with metrics.timed_phase("serialize"):
+        changes_json = serializer.encode_rows(changes)
+    response = Response(changes_json, mimetype="application/json", status=200)
+    # Telling the client which version to ask for next, and if the page is full it should ask again right away since more changes are waiting
+    response.headers["X-Next-Since"] = str(changes[-1][0] if len(changes) > 0 else since)
+    return response
+
+# Creating a generator that sends the changes after a version as Server-Sent Events and keeps sending new ones as they are committed
+# It never holds a database connection while waiting, and it ends after change_stream_max_seconds so the client reconnects from its Last-Event-ID
+def generate_change_events(since, use_primary):
+    changefeed.notifier.count_stream(1)
+    ends_at = time.monotonic() + settings.change_stream_max_seconds
+    is_first_read = True
+    # Telling the EventSource how long to wait before reconnecting once the stream ends
+    chunk = f"retry: {settings.change_stream_retry_ms}\n\n".encode("ascii")
+    # Creating a try-except block to catch errors while the changes are being streamed
+    try:
+        while True:
+            # Reading the generation before the change log, so a write committed after the read wakes up the wait below
+            generation = changefeed.notifier.current_generation()
+            with dbconnect.pooled_read_connection(use_primary) as conn:
+                changes = animaldb.select_changes(conn, since, settings.stream_batch_size)
+            is_first_read = False
+            if(len(changes) > 0):
+                with metrics.timed_phase("serialize"):
+                    chunk += serializer.encode_change_events(changes)
+                since = changes[-1][0]
+            # Sending a comment when there is nothing new, which keeps proxies from closing an idle stream and finds out if the client went away
+            yield chunk if chunk != b"" else b": no new changes\n\n"
+            chunk = b""
+            remaining = ends_at - time.monotonic()
+            if(remaining <= 0):
+                return
+            # Reading the next batch right away if this one was full, and otherwise waiting for a write from this process or for the next poll of the database
+            if(len(changes) < settings.stream_batch_size):
+                changefeed.notifier.wait(generation, min(settings.change_stream_poll_seconds, remaining))
+    # Raising the DatabaseUnavailableError exception to the handler if the first read fails so the client gets a 503 response, or ending the stream if a later read fails
+    except dbconnect.DatabaseUnavailableError:
+        if(is_first_read):
+            raise
+        print("The database became unavailable while streaming the animal changes.")
         traceback.print_exc()
     # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
-    except mariadb.DatabaseError:
-        print("Error detected in the database and resulted in a connection failure.")
+    except storage.backend.DatabaseError:
+        print("Error detected in the database while streaming the animal changes.")
         traceback.print_exc()
     # Raising a general exception to catch all other errors, printing a general error message and the traceback
-    except:
-        print("An error has occured.")
+    # The client disconnecting closes this generator with GeneratorExit, which is not caught here
+    except Exception:
+        print("An error has occured while streaming the animal changes.")
         traceback.print_exc()
+    finally:
+        changefeed.notifier.count_stream(-1)
 
-    # Closing the cursor and database connection
-    close_db_connection_and_cursor(conn, cursor)
-
-    # If the list of animals was successfully retrieved from the database, convert the list of animals into JSON format and send a client success response
-    if(animals_list != None):
-        animals_list_json = json.dumps(animals_list, default=str)
-        return Response(animals_list_json, mimetype="application/json", status=200)
-    # If the list of animals was not retrieved from the database, send the user a server error response
-    else:
-        return Response("Failed to retrieve animals from database.", mimetype="text/plain", status=500)
+# Creating a GET request to the "animals/changes/stream" endpoint to push the changes after a version to an EventSource as they are committed
+@app.get("/animals/changes/stream")
+def stream_animal_changes():
+    # Creating a try-except block to catch an invalid since argument
+    try:
+        since = get_since_arg()
+    except ValueError:
+        traceback.print_exc()
+        return Response("The since argument must be a non-negative integer.", mimetype="text/plain", status=400)
+    events = generate_change_events(since, wants_primary_read())
+    # Reading the change log before the response starts so a database error can still be reported with an error response
+    first_chunk = next(events, None)
+    if(first_chunk == None):
+        return Response("Failed to retrieve the animal changes from database.", mimetype="text/plain", status=500)
+    response = Response(prepend_chunk(first_chunk, events), mimetype="text/event-stream", status=200)
+    response.headers["Cache-Control"] = "no-cache"
+    # Asking proxies such as nginx to pass each event on as soon as it is sent instead of buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 # Creating a POST request to the "animals" endpoint to create an animal
 @app.post("/animals")
 def create_animal():
     # Creating a try-except block to catch errors when receiving the user's input
     try:
-        # Converting the user's data as a string
-        animal_name = str(request.json['name'])
-        # Checking the validity of the animal name
-        is_animal_name_valid = check_invalid_chars(animal_name)
+        # Checking the validity of the animal name as it was sent, so a name that is not a string is refused, and getting its normalized form
+        animal_name, name_error = validate_name(request.json['name'])
         # If the user sent an invalid animal name, send the user a client error response
-        if(is_animal_name_valid == False):
-            return Response("Invalid animal name being passed to the database.", mimetype="text/plain", status=400) 
+        if(name_error != None):
+            return Response(f"Invalid animal name being passed to the database. {name_error}", mimetype="text/plain", status=400)
     # Raising the error exception if the regular expression library is unable to compile the data being passed to it
     except re.error:
         print("An error occured with processing the regular expression.")
@@ -110,39 +439,36 @@ def create_animal():
         # Sending the user a client error response and stopping the function from running the next lines of code that interacts with the database
         return Response("Invalid animal name was passed to the database.", mimetype="text/plain", status=400)
 
-    # If the user sends valid data, open the database connection and create a cursor
-    conn = dbconnect.open_db_connection()
-    cursor = dbconnect.create_db_cursor(conn)
-
+    # If the user sends valid data, store it in the database
     # Initializing the row count and id and assigning it a value so that it can still be referenced after the try-except block
     row_count = 0
     new_id = None
 
-    # Checking to see if the database connection is opened and whether the cursor is created
-    check_db_connection_and_cursor(conn, cursor)
-
     # Creating a try-except block to catch errors when inserting the user's data into the database
     try:
         # Inserting the user's data into the database and commiting the changes
-        cursor.execute("INSERT INTO animal(name) VALUES(?)", [animal_name,])
-        conn.commit()
         # Checking to see if the user's data was stored in the database and getting the id of new animal
-        row_count = cursor.rowcount
-        new_id = cursor.lastrowid
+        row_count, new_id = run_single_write(animaldb.insert_animal, animal_name)
+    # Raising the DatabaseUnavailableError exception again so the client gets a 503 Service Unavailable response with a Retry-After header
+    except dbconnect.DatabaseUnavailableError:
+        raise
+    # Raising the WriteTimeoutError exception again so the client gets a 504 Gateway Timeout response saying the write may still be applied
+    except group_commit.WriteTimeoutError:
+        raise
     # Raising an IntegrityError exception if the user sends an animal that already exists in the database, printing an error message and the traceback
-    except mariadb.IntegrityError:
+    except storage.backend.IntegrityError:
         print(f"Unique key constraint failure. The animal already exists in the database.")
         traceback.print_exc()
     # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
-    except mariadb.OperationalError:
+    except storage.backend.OperationalError:
         print(f"An operational error has occured when creating a new animal.")
         traceback.print_exc()
     # Raising the ProgrammingError exception for errors made by the programmer, printing an error message and the traceback
-    except mariadb.ProgrammingError:
+    except storage.backend.ProgrammingError:
         print(f"Invalid SQL syntax.")
         traceback.print_exc()
     # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
-    except mariadb.DatabaseError:
+    except storage.backend.DatabaseError:
         print(f"An error in the database has occured. Failed to create a new animal.")
         traceback.print_exc()
     # Raising a general exception to catch all other errors, printing a general error message and the traceback
@@ -150,16 +476,14 @@ def create_animal():
         print("An error has occured.")
         traceback.print_exc()
 
-    # Closing the cursor and database connection
-    close_db_connection_and_cursor(conn, cursor)
-
     # If the user's data was stored in the database and an id was created for the new animal, send the user the new animal created in JSON format and a client success response
     if(row_count == 1 and new_id != None):
         new_animal = {
             'id': new_id,
             'name': animal_name
         }
-        new_animal_json = json.dumps(new_animal, default=str)
+        with metrics.timed_phase("serialize"):
+            new_animal_json = serializer.dumps(new_animal)
         return Response(new_animal_json, mimetype="application/json", status=201)
     # If the database failed to store the user's animal, send the user a server error response
     else:
@@ -170,14 +494,13 @@ def create_animal():
 def edit_animal():
     # Creating a try-except block to catch errors when receiving the user's data
     try:
-        # Converting the id into an integer data type and converting the name into a string data type
+        # Converting the id into an integer data type
         animal_id = int(request.json['id'])
-        animal_name = str(request.json['name'])
-        # Checking the validity of the animal name
-        is_animal_name_valid = check_invalid_chars(animal_name)
+        # Checking the validity of the animal name and getting its normalized form
+        animal_name, name_error = validate_name(request.json['name'])
         # If the user sent an invalid animal name, send the user a client error response
-        if(is_animal_name_valid == False):
-            return Response("Invalid animal name being passed to the database.", mimetype="text/plain", status=400)
+        if(name_error != None):
+            return Response(f"Invalid animal name being passed to the database. {name_error}", mimetype="text/plain", status=400)
     # Raising the error exception if the regular expression library is unable to compile the data being passed to it
     except re.error:
         print("An error occured with processing the regular expression.")
@@ -193,33 +516,31 @@ def edit_animal():
         # Sending the user a client error response and stopping the function for running the next lines of code that interacts with the database
         return Response("Invalid data was being passed to the database.", mimetype="text/plain", status=400)
 
-    # If the user sends valid data, open the database connection and create a cursor 
-    conn = dbconnect.open_db_connection()
-    cursor = dbconnect.create_db_cursor(conn)
-
+    # If the user sends valid data, store it in the database
     # Initializing the row count and assigning it a value so that it can still be referenced after the try-except block
     row_count = 0
 
-    # Checking to see if the database connection is opened and whether the cursor is created
-    check_db_connection_and_cursor(conn, cursor)
-
     # Creating a try-except block to catch errors when updating the data in the database
     try:
         # Editing the old animal with the new animal and committing the changes
-        cursor.execute("UPDATE animal SET name = ? WHERE id = ?", [animal_name, animal_id])
-        conn.commit()
         # Checking to see if the user's data was stored in the database
-        row_count = cursor.rowcount
+        row_count = run_single_write(animaldb.update_animal, animal_id, animal_name)
+    # Raising the DatabaseUnavailableError exception again so the client gets a 503 Service Unavailable response with a Retry-After header
+    except dbconnect.DatabaseUnavailableError:
+        raise
+    # Raising the WriteTimeoutError exception again so the client gets a 504 Gateway Timeout response saying the write may still be applied
+    except group_commit.WriteTimeoutError:
+        raise
     # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
-    except mariadb.OperationalError:
+    except storage.backend.OperationalError:
         print(f"An operational error has occured when storing the edited animal in the database.")
         traceback.print_exc()
     # Raising the ProgrammingError exception for errors made by the programmer, printing an error message and the traceback
-    except mariadb.ProgrammingError:
+    except storage.backend.ProgrammingError:
         print(f"Invalid SQL syntax.")
         traceback.print_exc()
     # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
-    except mariadb.DatabaseError:
+    except storage.backend.DatabaseError:
         print(f"An error in the database has occured. Failed to stored edited animal in the database.")
         traceback.print_exc()
     # Raising a general exception to catch all other errors, printing a general error message and the traceback
@@ -227,16 +548,14 @@ def edit_animal():
         print("An error has occured.")
         traceback.print_exc()
 
-    # Closing the cursor and database connection
-    close_db_connection_and_cursor(conn, cursor)
-
     # If the edited animal was successfully stored into the database, send the user the edited animal in JSON format and a client success response
     if(row_count == 1):
         edit_animal = {
             'id': animal_id,
             'name': animal_name
         }
-        edit_animal_json = json.dumps(edit_animal, default=str)
+        with metrics.timed_phase("serialize"):
+            edit_animal_json = serializer.dumps(edit_animal)
         return Response(edit_animal_json, mimetype="application/json", status=200)
     # If the database failed to store the edited animal, send the user a server error response
     else:
@@ -260,33 +579,31 @@ def delete_animal():
         # Sending the user a client error response and stopping the function for running the next lines of code that interacts with the database
         return Response("Invalid data was passed to the database.", mimetype="text/plain", status=400)
 
-    # If the user sends a valid id, open the database connection and create a cursor
-    conn = dbconnect.open_db_connection()
-    cursor = dbconnect.create_db_cursor(conn)
-
+    # If the user sends a valid id, delete the animal from the database
     # Initializing the row count and assigning it a value so that it can still be referenced after the try-except block
     row_count = 0
 
-    # Checking to see if the database connection is opened and whether the cursor is created
-    check_db_connection_and_cursor(conn, cursor)
-
     # Creating a try-except block to catch errors when deleting an animal from the database
     try:
         # Deleting an animal from the database and committing the changes
-        cursor.execute("DELETE FROM animal WHERE id = ?", [animal_id,])
-        conn.commit()
-        # Checking to see if the user's data was stored in the database
-        row_count = cursor.rowcount
+        # Checking to see if the animal was deleted from the database
+        row_count = run_single_write(animaldb.delete_animal, animal_id)
+    # Raising the DatabaseUnavailableError exception again so the client gets a 503 Service Unavailable response with a Retry-After header
+    except dbconnect.DatabaseUnavailableError:
+        raise
+    # Raising the WriteTimeoutError exception again so the client gets a 504 Gateway Timeout response saying the write may still be applied
+    except group_commit.WriteTimeoutError:
+        raise
     # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
-    except mariadb.OperationalError:
+    except storage.backend.OperationalError:
         print(f"\nAn operational error has occured. Failed to delete animal in the database.\n")
         traceback.print_exc()
     # Raising the ProgrammingError exception for errors made by the programmer, printing an error message and the traceback
-    except mariadb.ProgrammingError:
+    except storage.backend.ProgrammingError:
         print(f"\nInvalid SQL syntax.\n")
         traceback.print_exc()
     # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
-    except mariadb.DatabaseError:
+    except storage.backend.DatabaseError:
         print(f"\nAn error in the database has occured. Failed to delete animal in the database.\n")
         traceback.print_exc()
     # Raising a general exception to catch all other errors, printing a general error message and the traceback
@@ -294,9 +611,6 @@ def delete_animal():
         print("An error has occured.")
         traceback.print_exc()
 
-    # Closing the cursor and database connection
-    close_db_connection_and_cursor(conn, cursor)
-
     # If the database successfully deleted the animal, send a client success response
     if(row_count == 1):
         return Response(f"Animal {animal_id} was successfully deleted.", mimetype="application/json", status=200)
@@ -304,5 +618,205 @@ def delete_animal():
     else:
         return Response("Failed to delete animal.", mimetype="text/plain", status=500)
 
-# Running the flask server with debug mode turned on
-app.run(debug=True)
\ No newline at end of file
+# Creating a function that runs one write and commits it, either on a connection of its own or through the group commit writer when it is turned on
+# The write function receives the connection and the arguments, and its result is returned once the write is committed
+def run_single_write(write_function, *args):
+    # The group commit writer clears the cached animal lists and wakes the change streams itself once its batch is committed
+    if(settings.group_commit_enabled):
+        return group_commit.submit_write(write_function, *args)
+    # Borrowing a database connection from the pool
+    with dbconnect.pooled_db_connection() as conn:
+        with animaldb.write_transaction(conn):
+            result = write_function(conn, *args)
+    # Clearing the cached animal lists now that the table has changed, and pushing the change to the open change streams
+    cache.animals_cache.invalidate()
+    changefeed.notifier.notify()
+    return result
+
+# Creating a function that reads the list of animals sent to a bulk endpoint, returning None if the body is not a list of the allowed size
+def get_bulk_items():
+    items = request.get_json(silent=True)
+    if(not isinstance(items, list) or len(items) == 0 or len(items) > settings.bulk_max_items):
+        return None
+    return items
+
+# Creating a function that runs a bulk write on one connection and commits it once, returning False if it failed and was rolled back
+# The write function receives the connection and fills in the results, so every statement of the batch shares one transaction
+def run_bulk_write(write_function):
+    is_committed = False
+    # Borrowing a database connection from the pool
+    with dbconnect.pooled_db_connection() as conn:
+        # Creating a try-except block to catch errors when writing the batch to the database
+        try:
+            with animaldb.write_transaction(conn):
+                is_changed = write_function(conn)
+            is_committed = True
+            # Clearing the cached animal lists now that the table has changed, and pushing the changes to the open change streams
+            if(is_changed):
+                cache.animals_cache.invalidate()
+                changefeed.notifier.notify()
+        # Raising an IntegrityError exception if another request stored a conflicting animal while the batch was being written, printing an error message and the traceback
+        except storage.backend.IntegrityError:
+            print("Unique key constraint failure. The batch of animals was not stored in the database.")
+            traceback.print_exc()
+        # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
+        except storage.backend.OperationalError:
+            print("An operational error has occured when writing the batch of animals.")
+            traceback.print_exc()
+        # Raising the ProgrammingError exception for errors made by the programmer, printing an error message and the traceback
+        except storage.backend.ProgrammingError:
+            print("Invalid SQL syntax.")
+            traceback.print_exc()
+        # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
+        except storage.backend.DatabaseError:
+            print("An error in the database has occured. Failed to write the batch of animals.")
+            traceback.print_exc()
+        # Raising a general exception to catch all other errors, printing a general error message and the traceback
+        except:
+            print("An error has occured.")
+            traceback.print_exc()
+
+        # Returning the connection to the pool once the with block ends, which rolls back the batch if it was not committed
+    return is_committed
+
+# Creating a POST request to the "animals/bulk" endpoint to create many animals in one transaction
+@app.post("/animals/bulk")
+def create_animals_bulk():
+    items = get_bulk_items()
+    if(items == None):
+        return Response(f"Expected a JSON array of 1 to {settings.bulk_max_items} animals.", mimetype="text/plain", status=400)
+
+    # Validating every animal first and keeping one result per animal, in the same order the animals were sent
+    results = [None] * len(items)
+    # Checking every name in one pass, where a missing name counts as an invalid one
+    valid_names, name_errors = validate_names([item.get('name') if isinstance(item, dict) else None for item in items])
+    for index, name_error in name_errors:
+        results[index] = {'error': name_error}
+    # The names are compared with their case folded, since the database treats names that only differ in case as the same name
+    names_to_create = {}
+    for index, animal_name in valid_names:
+        if(animal_name.casefold() in names_to_create):
+            results[index] = {'error': "Duplicate animal name in the batch."}
+        else:
+            names_to_create[animal_name.casefold()] = (index, animal_name)
+
+    # Creating a function that inserts the valid animals with one executemany call and looks up their new ids
+    def write_animals(conn):
+        if(len(names_to_create) == 0):
+            return False
+        # Reporting the animals that already exist instead of letting one of them fail the whole batch
+        for existing_name, existing_id in animaldb.select_animals_by_names(conn, [animal_name for index, animal_name in names_to_create.values()]):
+            index, animal_name = names_to_create.pop(existing_name.casefold())
+            results[index] = {'error': "Unique key constraint failure. The animal already exists in the database."}
+        names = [animal_name for index, animal_name in names_to_create.values()]
+        if(len(names) == 0):
+            return False
+        for animal_name, new_id in animaldb.insert_animals(conn, names):
+            index, animal_name = names_to_create[animal_name.casefold()]
+            results[index] = {'id': new_id, 'name': animal_name}
+        return True
+
+    if(run_bulk_write(write_animals) == False):
+        return Response("Failed to create the animals.", mimetype="text/plain", status=500)
+    return Response(serializer.dumps(results), mimetype="application/json", status=200)
+
+# Creating a PATCH request to the "animals/bulk" endpoint to edit many animals in one transaction
+@app.patch("/animals/bulk")
+def edit_animals_bulk():
+    items = get_bulk_items()
+    if(items == None):
+        return Response(f"Expected a JSON array of 1 to {settings.bulk_max_items} animals.", mimetype="text/plain", status=400)
+
+    # Validating every animal first and keeping one result per animal, in the same order the animals were sent
+    results = [None] * len(items)
+    # Checking every name in one pass, where a missing name counts as an invalid one
+    valid_names, name_errors = validate_names([item.get('name') if isinstance(item, dict) else None for item in items])
+    for index, name_error in name_errors:
+        results[index] = {'error': name_error}
+    # The names are compared with their case folded, since the database treats names that only differ in case as the same name
+    animals_to_edit = {}
+    names_in_batch = set()
+    for index, animal_name in valid_names:
+        try:
+            animal_id = int(items[index]['id'])
+        except (TypeError, KeyError, ValueError):
+            results[index] = {'error': "Invalid animal id."}
+            continue
+        if(animal_id in animals_to_edit or animal_name.casefold() in names_in_batch):
+            results[index] = {'error': "Duplicate animal id or name in the batch."}
+        else:
+            animals_to_edit[animal_id] = (index, animal_name)
+            names_in_batch.add(animal_name.casefold())
+
+    # Creating a function that updates the existing animals with one executemany call
+    def write_animals(conn):
+        if(len(animals_to_edit) == 0):
+            return False
+        existing_ids = animaldb.select_existing_ids(conn, list(animals_to_edit))
+        # Reporting names that are already used by another animal, even one that is renamed in the same batch, so the order of the updates never matters
+        # Renaming an animal to its own name in another case is allowed, since the name still belongs to it
+        name_owners = {}
+        for existing_name, existing_id in animaldb.select_animals_by_names(conn, [animal_name for index, animal_name in animals_to_edit.values()]):
+            name_owners[existing_name.casefold()] = existing_id
+        updates = []
+        for animal_id, (index, animal_name) in animals_to_edit.items():
+            if(animal_id not in existing_ids):
+                results[index] = {'error': "The animal does not exist."}
+            elif(name_owners.get(animal_name.casefold(), animal_id) != animal_id):
+                results[index] = {'error': "Unique key constraint failure. The animal already exists in the database."}
+            else:
+                updates.append([animal_name, animal_id])
+                results[index] = {'id': animal_id, 'name': animal_name}
+        if(len(updates) == 0):
+            return False
+        animaldb.update_animals(conn, updates)
+        return True
+
+    if(run_bulk_write(write_animals) == False):
+        return Response("Failed to edit the animals.", mimetype="text/plain", status=500)
+    return Response(serializer.dumps(results), mimetype="application/json", status=200)
+
+# Creating a DELETE request to the "animals/bulk" endpoint to delete many animals in one transaction
+@app.delete("/animals/bulk")
+def delete_animals_bulk():
+    items = get_bulk_items()
+    if(items == None):
+        return Response(f"Expected a JSON array of 1 to {settings.bulk_max_items} animals.", mimetype="text/plain", status=400)
+
+    # Validating every id first and keeping one result per animal, in the same order the animals were sent
+    results = [None] * len(items)
+    ids_to_delete = {}
+    for index, item in enumerate(items):
+        try:
+            animal_id = int(item['id'])
+        except (TypeError, KeyError, ValueError):
+            results[index] = {'error': "Invalid animal id."}
+            continue
+        if(animal_id in ids_to_delete):
+            results[index] = {'error': "Duplicate animal id in the batch."}
+        else:
+            ids_to_delete[animal_id] = index
+
+    # Creating a function that deletes the existing animals with one executemany call
+    def write_animals(conn):
+        if(len(ids_to_delete) == 0):
+            return False
+        existing_ids = animaldb.select_existing_ids(conn, list(ids_to_delete))
+        for animal_id, index in ids_to_delete.items():
+            if(animal_id in existing_ids):
+                results[index] = {'id': animal_id}
+            else:
+                results[index] = {'error': "The animal does not exist."}
+        if(len(existing_ids) == 0):
+            return False
+        animaldb.delete_animals(conn, existing_ids)
+        return True
+
+    if(run_bulk_write(write_animals) == False):
+        return Response("Failed to delete the animals.", mimetype="text/plain", status=500)
+    return Response(serializer.dumps(results), mimetype="application/json", status=200)
+
+# Running the flask development server when this file is run directly, using the serving settings instead of always turning debug mode on
+# In production the app is served by serve.py instead
+if(__name__ == "__main__"):
+    app.run(host=settings.bind_host, port=settings.bind_port, debug=settings.debug)
@@ -0,0 +1,355 @@
+import aiomysql
+import animaldb
+import asyncio
+import cache
+import contextlib
+import dbcreds
+from quart import Quart, request, Response
+import serializer
+import settings
+import time
+import traceback
+from validation import validate_name
+
+# This is the async version of the four /animals handlers in app.py, served by uvicorn through serve.py
+# It uses aiomysql so a request waiting on the database does not hold a thread, letting each worker serve thousands of slow clients
+
+# Initializing the quart server
+app = Quart(__name__)
+
+# The pool is created when the server starts because aiomysql pools belong to the event loop that created them
+db_pool = None
+
+# Creating the async connection pool when the server starts
+@app.before_serving
+async def open_db_pool():
+    global db_pool
+    db_pool = await aiomysql.create_pool(user=dbcreds.user, password=dbcreds.password, host=dbcreds.host, port=dbcreds.port, db=dbcreds.database, minsize=settings.pool_min_size, maxsize=settings.pool_max_size, pool_recycle=settings.pool_idle_timeout, autocommit=False)
+
+# Closing every pooled connection when the server stops
+@app.after_serving
+async def close_db_pool():
+    db_pool.close()
+    await db_pool.wait_closed()
+
+# The number of writes this worker has committed, and the condition its change streams wait on so a write wakes them right away
+# A worker only hears about its own writes, so the streams also read the change log every change_stream_poll_seconds for writes made by other workers
+change_generation = 0
+change_condition = asyncio.Condition()
+
+# Creating a function that wakes up the change streams of this worker after a write was committed
+async def notify_change():
+    global change_generation
+    async with change_condition:
+        change_generation += 1
+        change_condition.notify_all()
+
+# Creating a function that waits until this worker commits a write after the given generation, or until the timeout runs out
+async def wait_for_change(generation, timeout):
+    async with change_condition:
+        try:
+            await asyncio.wait_for(change_condition.wait_for(lambda: change_generation != generation), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+# Creating a context manager that borrows a connection from the async pool and returns it to the pool afterwards
+@contextlib.asynccontextmanager
+async def pooled_db_connection():
+    conn = None
+    # Using a try-except block to catch errors when borrowing a connection from the pool
+    try:
+        conn = await asyncio.wait_for(db_pool.acquire(), settings.pool_borrow_timeout)
+    # Raising the TimeoutError exception if every connection stayed in use for the whole borrow timeout
+    except asyncio.TimeoutError:
+        print("Timed out waiting for a free database connection.")
+        traceback.print_exc()
+    # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
+    except aiomysql.OperationalError:
+        print("Operational errors detected in the database connection.")
+        traceback.print_exc()
+    # Raising a general exception to catch all other errors, printing a general error message and the traceback
+    except Exception:
+        print("An error has occured. Failed to borrow a database connection.")
+        traceback.print_exc()
+    try:
+        yield conn
+    finally:
+        if(conn != None):
+            # Rolling back anything that was not committed, since aiomysql closes connections that are returned in the middle of a transaction
+            try:
+                await conn.rollback()
+            except Exception:
+                conn.close()
+            db_pool.release(conn)
+
+# Creating a function that adds a change to the change log in the write's transaction, taking the version number from the counter row like animaldb.record_changes does
+async def record_change(cursor, operation, animal_id, animal_name):
+    await cursor.execute("UPDATE animal_change_version SET version = version + 1 WHERE id = 1")
+    await cursor.execute("SELECT version FROM animal_change_version WHERE id = 1")
+    version = (await cursor.fetchone())[0]
+    await cursor.execute("INSERT INTO animal_change(version, operation, animal_id, name) VALUES(%s, %s, %s, %s)", [version, operation, animal_id, animal_name])
+
+# Creating a function that builds the query and parameters for a page of animals with animaldb, swapping its ? placeholders for the %s placeholders of aiomysql
+# The async app only runs on the mariadb backend, so the search conditions are the MariaDB ones, and none of them has a % that aiomysql would need escaped
+def build_select_animals_query(after_id, limit, search=None):
+    sql, params = animaldb.build_select_animals_query(after_id, limit, search)
+    return sql.replace("?", "%s"), params
+
+# Creating a function that runs one statement on a pooled connection, returning the rows, row count and last row id, or None if it failed
+# A write that changes an animal passes make_change, which turns the cursor into the (operation, id, name) of the change to add to the change log
+async def run_query(query, params, is_write=False, make_change=None):
+    async with pooled_db_connection() as conn:
+        if(conn == None):
+            return None
+        # Creating a try-except block to catch errors when running the statement
+        try:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, params)
+                rows = await cursor.fetchall() if cursor.description != None else None
+                row_count, last_row_id = cursor.rowcount, cursor.lastrowid
+                if(make_change != None and row_count > 0):
+                    await record_change(cursor, *make_change(cursor))
+                if(is_write):
+                    await conn.commit()
+            # Pushing the change to the open change streams of this worker now that it is committed
+            if(make_change != None and row_count > 0):
+                await notify_change()
+            return rows, row_count, last_row_id
+        # Raising an IntegrityError exception if the animal already exists in the database, printing an error message and the traceback
+        except aiomysql.IntegrityError:
+            print("Unique key constraint failure. The animal already exists in the database.")
+            traceback.print_exc()
+        # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
+        except aiomysql.OperationalError:
+            print("An operational error has occured when running the query.")
+            traceback.print_exc()
+        # Raising the ProgrammingError exception for errors made by the programmer, printing an error message and the traceback
+        except aiomysql.ProgrammingError:
+            print("Invalid SQL syntax.")
+            traceback.print_exc()
+        # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
+        except aiomysql.DatabaseError:
+            print("An error in the database has occured.")
+            traceback.print_exc()
+        # Raising a general exception to catch all other errors, printing a general error message and the traceback
+        except Exception:
+            print("An error has occured.")
+            traceback.print_exc()
+    return None
+
+# Creating a GET request to the "animals" endpoint to get the list of animals
+@app.get("/animals")
+async def get_animals_list():
+    # Reading the same pagination arguments as the flask app
+    try:
+        after_id = int(request.args.get("after_id", 0))
+        limit = request.args.get("limit")
+        if(limit != None):
+            limit = int(limit)
+            if(limit < 1 or limit > settings.page_max_limit):
+                raise ValueError(f"The limit must be between 1 and {settings.page_max_limit}.")
+        if(after_id < 0):
+            raise ValueError("The after_id must not be negative.")
+    except ValueError:
+        traceback.print_exc()
+        return Response(f"The after_id must be a non-negative integer and the limit must be an integer between 1 and {settings.page_max_limit}.", mimetype="text/plain", status=400)
+    # Reading the same search arguments as the flask app
+    try:
+        search = animaldb.parse_search_args(request.args)
+    except ValueError as error:
+        return Response(str(error), mimetype="text/plain", status=400)
+
+    # Reading the change log version before the animals, so a change made in between is replayed by the change feed rather than missed
+    version_result = await run_query("SELECT version FROM animal_change_version WHERE id = 1", [])
+    result = await run_query(*build_select_animals_query(after_id, limit, search)) if version_result != None else None
+
+    # If the list of animals was not retrieved from the database, send the user a server error response
+    if(result == None):
+        return Response("Failed to retrieve animals from database.", mimetype="text/plain", status=500)
+    change_version = version_result[0][0][0]
+    animals_list = result[0]
+    animals_list_json = serializer.encode_rows(animals_list)
+    etag = cache.make_etag(animals_list_json)
+    # If the client already has this version of the list, send a 304 Not Modified response without the body
+    if(cache.etag_matches(request.headers.get("If-None-Match"), etag)):
+        response = Response("", status=304)
+    else:
+        response = Response(animals_list_json, mimetype="application/json", status=200)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if(limit != None and len(animals_list) == limit):
+        response.headers["X-Next-After-Id"] = str(animals_list[-1][1])
+    # Telling the client which change log version the list is at, so it can follow the changes from there
+    response.headers["X-Change-Version"] = str(change_version)
+    return response
+
+# Creating a GET request to the "animals/<id>" endpoint to get one animal by its id
+@app.get("/animals/<int:animal_id>")
+async def get_animal(animal_id):
+    result = await run_query("SELECT name, id FROM animal WHERE id = %s", [animal_id,])
+
+    # If the query failed, send the user a server error response
+    if(result == None):
+        return Response("Failed to retrieve the animal from database.", mimetype="text/plain", status=500)
+    # If there is no animal with this id, send the user a client error response
+    if(len(result[0]) == 0):
+        return Response(f"Animal {animal_id} does not exist.", mimetype="text/plain", status=404)
+    animal = result[0][0]
+    found_animal = {
+        'id': animal[1],
+        'name': animal[0]
+    }
+    return Response(serializer.dumps(found_animal), mimetype="application/json", status=200)
+
+# Creating a GET request to the "animals/changes" endpoint to get the changes made after a change log version, like the flask app
+@app.get("/animals/changes")
+async def get_animal_changes():
+    # Reading the same arguments as the flask app
+    try:
+        since = int(request.args["since"])
+        limit = int(request.args.get("limit", settings.page_max_limit))
+        if(since < 0 or limit < 1 or limit > settings.page_max_limit):
+            raise ValueError(f"The limit must be between 1 and {settings.page_max_limit}.")
+    except (KeyError, ValueError):
+        traceback.print_exc()
+        return Response(f"The since argument must be a non-negative integer and the limit must be an integer between 1 and {settings.page_max_limit}.", mimetype="text/plain", status=400)
+
+    result = await run_query("SELECT version, operation, animal_id, name FROM animal_change WHERE version > %s ORDER BY version LIMIT %s", [since, limit])
+
+    # If the changes were not retrieved from the database, send the user a server error response
+    if(result == None):
+        return Response("Failed to retrieve the animal changes from database.", mimetype="text/plain", status=500)
+    changes = result[0]
+    response = Response(serializer.encode_rows(changes), mimetype="application/json", status=200)
+    response.headers["X-Next-Since"] = str(changes[-1][0] if len(changes) > 0 else since)
+    return response
+
+# Creating a generator that sends the changes after a version as Server-Sent Events and keeps sending new ones as they are committed, like the flask app
+# Waiting does not hold a connection or a thread, and the stream ends after change_stream_max_seconds so the client reconnects from its Last-Event-ID
+async def generate_change_events(since):
+    ends_at = time.monotonic() + settings.change_stream_max_seconds
+    # Telling the EventSource how long to wait before reconnecting once the stream ends
+    chunk = f"retry: {settings.change_stream_retry_ms}\n\n".encode("ascii")
+    while True:
+        # Reading the generation before the change log, so a write committed after the read wakes up the wait below
+        generation = change_generation
+        result = await run_query("SELECT version, operation, animal_id, name FROM animal_change WHERE version > %s ORDER BY version LIMIT %s", [since, settings.stream_batch_size])
+        # Ending the stream if the change log could not be read, which sends an error response if it was the first read
+        if(result == None):
+            return
+        changes = result[0]
+        if(len(changes) > 0):
+            chunk += serializer.encode_change_events(changes)
+            since = changes[-1][0]
+        # Sending a comment when there is nothing new, which keeps proxies from closing an idle stream and finds out if the client went away
+        yield chunk if chunk != b"" else b": no new changes\n\n"
+        chunk = b""
+        remaining = ends_at - time.monotonic()
+        if(remaining <= 0):
+            return
+        # Reading the next batch right away if this one was full, and otherwise waiting for a write from this worker or for the next poll of the database
+        if(len(changes) < settings.stream_batch_size):
+            await wait_for_change(generation, min(settings.change_stream_poll_seconds, remaining))
+
+# Creating a generator that sends a chunk that was already read and then the rest of the chunks
+async def prepend_chunk(first_chunk, chunks):
+    yield first_chunk
+    async for chunk in chunks:
+        yield chunk
+
+# Creating a GET request to the "animals/changes/stream" endpoint to push the changes after a version to an EventSource as they are committed
+@app.get("/animals/changes/stream")
+async def stream_animal_changes():
+    # Reading the version to start from, which an EventSource sends as Last-Event-ID when it reconnects
+    try:
+        since = int(request.headers.get("Last-Event-ID", request.args.get("since")))
+        if(since < 0):
+            raise ValueError("The since argument must not be negative.")
+    except (TypeError, ValueError):
+        traceback.print_exc()
+        return Response("The since argument must be a non-negative integer.", mimetype="text/plain", status=400)
+    events = generate_change_events(since)
+    # Reading the change log before the response starts so a database error can still be reported with an error response
+    first_chunk = await anext(events, None)
+    if(first_chunk == None):
+        return Response("Failed to retrieve the animal changes from database.", mimetype="text/plain", status=500)
+    response = Response(prepend_chunk(first_chunk, events), mimetype="text/event-stream", status=200)
+    # The stream ends itself after change_stream_max_seconds, so it is not cut off by the server's response timeout
+    response.timeout = None
+    response.headers["Cache-Control"] = "no-cache"
+    # Asking proxies such as nginx to pass each event on as soon as it is sent instead of buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# Creating a POST request to the "animals" endpoint to create an animal
+@app.post("/animals")
+async def create_animal():
+    # Creating a try-except block to catch errors when receiving the user's input
+    try:
+        animal_name, name_error = validate_name((await request.get_json())['name'])
+    except Exception:
+        traceback.print_exc()
+        return Response("Invalid animal name was passed to the database.", mimetype="text/plain", status=400)
+    # If the user sent an invalid animal name, send the user a client error response
+    if(name_error != None):
+        return Response(f"Invalid animal name being passed to the database. {name_error}", mimetype="text/plain", status=400)
+
+    result = await run_query("INSERT INTO animal(name) VALUES(%s)", [animal_name,], is_write=True, make_change=lambda cursor: ("create", cursor.lastrowid, animal_name))
+
+    # If the user's data was stored in the database, send the user the new animal created in JSON format and a client success response
+    if(result != None and result[1] == 1):
+        new_animal = {
+            'id': result[2],
+            'name': animal_name
+        }
+        return Response(serializer.dumps(new_animal), mimetype="application/json", status=201)
+    # If the database failed to store the user's animal, send the user a server error response
+    else:
+        return Response("Failed to create a new animal.", mimetype="text/plain", status=500)
+
+# Creating a PATCH request to the "animals" endpoint to edit an animal
+@app.patch("/animals")
+async def edit_animal():
+    # Creating a try-except block to catch errors when receiving the user's data
+    try:
+        data = await request.get_json()
+        animal_id = int(data['id'])
+        animal_name, name_error = validate_name(data['name'])
+    except Exception:
+        traceback.print_exc()
+        return Response("Invalid data was being passed to the database.", mimetype="text/plain", status=400)
+    # If the user sent an invalid animal name, send the user a client error response
+    if(name_error != None):
+        return Response(f"Invalid animal name being passed to the database. {name_error}", mimetype="text/plain", status=400)
+
+    result = await run_query("UPDATE animal SET name = %s WHERE id = %s", [animal_name, animal_id], is_write=True, make_change=lambda cursor: ("update", animal_id, animal_name))
+
+    # If the edited animal was successfully stored into the database, send the user the edited animal in JSON format and a client success response
+    if(result != None and result[1] == 1):
+        edit_animal = {
+            'id': animal_id,
+            'name': animal_name
+        }
+        return Response(serializer.dumps(edit_animal), mimetype="application/json", status=200)
+    # If the database failed to store the edited animal, send the user a server error response
+    else:
+        return Response("Failed to edit animal.", mimetype="text/plain", status=500)
+
+# Creating a DELETE request to the "animals" endpoint to delete an exisiting animal
+@app.delete("/animals")
+async def delete_animal():
+    # Creating a try-except block to catch error when receiving data from the user
+    try:
+        animal_id = int((await request.get_json())['id'])
+    except Exception:
+        traceback.print_exc()
+        return Response("Invalid data was passed to the database.", mimetype="text/plain", status=400)
+
+    result = await run_query("DELETE FROM animal WHERE id = %s", [animal_id,], is_write=True, make_change=lambda cursor: ("delete", animal_id, None))
+
+    # If the database successfully deleted the animal, send a client success response
+    if(result != None and result[1] == 1):
+        return Response(f"Animal {animal_id} was successfully deleted.", mimetype="application/json", status=200)
+    # If the database failed to delete the animal, send a server error response
+    else:
+        return Response("Failed to delete animal.", mimetype="text/plain", status=500)
@@ -0,0 +1,365 @@
+import argparse
+import http.client
+import json
+import math
+import platform
+import random
+import string
+import subprocess
+import sys
+import threading
+import time
+import timeit
+import urllib.parse
+
+# This is the load-test harness for the /animals endpoints
+# 1. Seed a local stand-in database:  python benchmark.py seed --rows 100000 --reset
+# 2. Start the API against the same database, then run a workload:  python benchmark.py run --url http://127.0.0.1:5000 --concurrency 1,8,32 --output new.json
+# 3. Compare two runs:  python benchmark.py compare old.json new.json
+# The microbenchmarks don't need a database:  python benchmark.py serializer --rows 100000  or  python benchmark.py validation --names 100000
+
+# The number of rows inserted with each executemany call when seeding
+seed_batch_size = 5000
+
+# Creating a function that turns a number into a unique name made only of letters so that it passes the animal name validation
+def number_to_name(number, prefix="Bench"):
+    letters = []
+    while True:
+        number, remainder = divmod(number, 26)
+        letters.append(string.ascii_lowercase[remainder])
+        if(number == 0):
+            break
+    return prefix + "".join(reversed(letters))
+
+# Creating a function that fills the animal table with a known number of rows
+def seed_animals(rows, reset):
+    # Importing the database module here so the microbenchmarks can run without database credentials
+    import dbconnect
+    import storage
+    conn = dbconnect.connect_to_database()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM animal")
+        existing_rows = cursor.fetchone()[0]
+        # Refusing to wipe a table that already has animals unless the user asked for it
+        if(existing_rows > 0 and not reset):
+            raise SystemExit(f"The animal table already has {existing_rows} rows. Pass --reset to delete them before seeding.")
+        if(reset):
+            cursor.execute("DELETE FROM animal")
+            # Starting the ids from 1 again, since deleting the rows does not reset the id counter and run picks its pages from the seeded ids
+            if(storage.backend.name == "sqlite"):
+                cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'animal'")
+            else:
+                cursor.execute("ALTER TABLE animal AUTO_INCREMENT = 1")
+        started_at = time.perf_counter()
+        for batch_start in range(0, rows, seed_batch_size):
+            batch_end = min(batch_start + seed_batch_size, rows)
+            cursor.executemany("INSERT INTO animal(name) VALUES(?)", [[number_to_name(number),] for number in range(batch_start, batch_end)])
+            conn.commit()
+        print(f"Seeded {rows} animals in {time.perf_counter() - started_at:.2f} seconds.")
+    finally:
+        cursor.close()
+        conn.close()
+
+# Creating a function that returns the value at a percentile of an already sorted list, using the nearest-rank method
+def percentile(sorted_values, percent):
+    if(len(sorted_values) == 0):
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+# Creating a function that summarizes a list of latencies in seconds as milliseconds
+def summarize_latencies(latencies, duration):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / duration if duration > 0 else 0,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+        "max_ms": latencies[-1] * 1000 if latencies else None
+    }
+
+# Creating a function that asks the running API for the id of its first animal, which is where the seeded ids start
+# The table may have been seeded before its id counter was reset, so the seeded ids don't always start at 1
+def fetch_first_id(url):
+    parsed_url = urllib.parse.urlsplit(url)
+    connection = http.client.HTTPConnection(parsed_url.hostname, parsed_url.port or 80, timeout=30)
+    try:
+        connection.request("GET", parsed_url.path.rstrip("/") + "/animals?limit=1")
+        response = connection.getresponse()
+        body = response.read()
+    finally:
+        connection.close()
+    if(response.status != 200):
+        raise SystemExit(f"Failed to read the first animal from {url}: HTTP {response.status}.")
+    animals = json.loads(body)
+    if(len(animals) == 0):
+        raise SystemExit("The animal table is empty. Seed it before running the benchmark.")
+    return animals[0][1]
+
+# Creating a class for one simulated client that keeps a single HTTP connection open and records how long each request takes
+class BenchmarkClient:
+    def __init__(self, url, client_number, run_tag, read_ratio, page_size, first_id, rows):
+        parsed_url = urllib.parse.urlsplit(url)
+        self.host = parsed_url.hostname
+        self.port = parsed_url.port or 80
+        self.base_path = parsed_url.path.rstrip("/")
+        self.client_number = client_number
+        self.read_ratio = read_ratio
+        self.page_size = page_size
+        # The pages are picked from the ids of the seeded rows, which run from first_id to first_id + rows - 1
+        self.first_id = first_id
+        self.rows = rows
+        self.random = random.Random(client_number)
+        # Every name this client creates starts with the run's tag and a fixed-width client number so that no two clients or runs create the same name
+        self.name_prefix = "Load" + run_tag + number_to_name(client_number, prefix="").rjust(3, "a")
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        # The ids of the animals this client created, so it only edits and deletes its own animals
+        self.created_ids = []
+        self.created_count = 0
+        self.latencies = {}
+        self.errors = {}
+
+    # Creating a function that sends one request, reopening the connection if the server closed it
+    def send(self, method, path, body=None):
+        headers = {"Content-Type": "application/json"} if body != None else {}
+        payload = json.dumps(body) if body != None else None
+        try:
+            self.connection.request(method, self.base_path + path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.connection.request(method, self.base_path + path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+        return response.status, response.read()
+
+    # Creating a function that picks and sends the next request of the mixed workload
+    def run_one(self):
+        if(self.random.random() < self.read_ratio):
+            operation = "GET /animals"
+            after_id = self.first_id - 1 + self.random.randint(0, max(self.rows - self.page_size, 0))
+            method, path, body = "GET", f"/animals?after_id={after_id}&limit={self.page_size}", None
+        else:
+            write_choice = self.random.random()
+            if(len(self.created_ids) == 0 or write_choice < 0.5):
+                operation = "POST /animals"
+                self.created_count += 1
+                name = number_to_name(self.created_count, prefix=self.name_prefix)
+                method, path, body = "POST", "/animals", {"name": name}
+            elif(write_choice < 0.8):
+                operation = "PATCH /animals"
+                self.created_count += 1
+                name = number_to_name(self.created_count, prefix=self.name_prefix)
+                method, path, body = "PATCH", "/animals", {"id": self.random.choice(self.created_ids), "name": name}
+            else:
+                operation = "DELETE /animals"
+                method, path, body = "DELETE", "/animals", {"id": self.created_ids.pop()}
+        started_at = time.perf_counter()
+        try:
+            status, response_body = self.send(method, path, body)
+        except Exception as error:
+            status, response_body = None, None
+            self.errors[operation + " " + type(error).__name__] = self.errors.get(operation + " " + type(error).__name__, 0) + 1
+        elapsed = time.perf_counter() - started_at
+        if(status != None and status >= 400):
+            self.errors[f"{operation} {status}"] = self.errors.get(f"{operation} {status}", 0) + 1
+        elif(status != None):
+            self.latencies.setdefault(operation, []).append(elapsed)
+            if(operation == "POST /animals"):
+                self.created_ids.append(json.loads(response_body)["id"])
+
+# Creating a function that runs the mixed workload at one concurrency level and summarizes the results
+def run_workload(url, concurrency, duration, warmup, read_ratio, page_size, first_id, rows):
+    run_tag = "".join(random.choice(string.ascii_lowercase) for letter in range(6))
+    clients = [BenchmarkClient(url, number, run_tag, read_ratio, page_size, first_id, rows) for number in range(concurrency)]
+    stop_at = time.perf_counter() + warmup + duration
+    measure_from = time.perf_counter() + warmup
+
+    # Creating a function that keeps one client busy until the run ends, throwing away the requests sent during the warmup
+    def drive(client):
+        while(time.perf_counter() < stop_at):
+            client.run_one()
+            if(time.perf_counter() < measure_from):
+                client.latencies.clear()
+                client.errors.clear()
+
+    threads = [threading.Thread(target=drive, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Merging the latencies and errors of every client
+    latencies_by_operation = {}
+    errors = {}
+    for client in clients:
+        for operation, latencies in client.latencies.items():
+            latencies_by_operation.setdefault(operation, []).extend(latencies)
+        for error, count in client.errors.items():
+            errors[error] = errors.get(error, 0) + count
+        client.connection.close()
+    all_latencies = [latency for latencies in latencies_by_operation.values() for latency in latencies]
+    return {
+        "concurrency": concurrency,
+        "overall": summarize_latencies(all_latencies, duration),
+        "operations": dict((operation, summarize_latencies(latencies, duration)) for operation, latencies in sorted(latencies_by_operation.items())),
+        "errors": errors
+    }
+
+# Creating a function that returns the current git commit so results can be traced back to the code they measured
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+# Creating a function that compares two result files and returns the metrics that got worse by more than the threshold
+def compare_results(old_results, new_results, threshold):
+    regressions = []
+    old_runs = dict((run["concurrency"], run) for run in old_results["runs"])
+    print(f"{'concurrency':>11} {'metric':<12} {'old':>10} {'new':>10} {'change':>8}")
+    for new_run in new_results["runs"]:
+        old_run = old_runs.get(new_run["concurrency"])
+        if(old_run == None):
+            continue
+        # Higher is better for throughput and lower is better for the latencies
+        for metric, higher_is_better in (("throughput", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False)):
+            old_value = old_run["overall"][metric]
+            new_value = new_run["overall"][metric]
+            if(old_value == None or new_value == None or old_value == 0):
+                continue
+            change = (new_value - old_value) / old_value
+            is_regression = (change < -threshold) if higher_is_better else (change > threshold)
+            marker = "  <-- regression" if is_regression else ""
+            print(f"{new_run['concurrency']:>11} {metric:<12} {old_value:>10.2f} {new_value:>10.2f} {change:>+8.1%}{marker}")
+            if(is_regression):
+                regressions.append((new_run["concurrency"], metric, change))
+    return regressions
+
+# Creating a function that times how long a function takes per call, taking the best of several repeats to hide noise from other processes
+def time_per_call(function, repeats):
+    timer = timeit.Timer(function)
+    calls, total = timer.autorange()
+    return min(timer.repeat(repeat=repeats, number=calls)) / calls
+
+# Creating a function that compares the old json.dumps(..., default=str) path with the serializer module on rows shaped like the cursor's rows
+def benchmark_serializer(rows, repeats):
+    import serializer
+    animal_rows = [(number_to_name(number), number + 1) for number in range(rows)]
+    batch_size = 500
+    results = {
+        "rows": rows,
+        "encoder": serializer.encoder_name,
+        # The list endpoint before and after
+        "old_list_seconds": time_per_call(lambda: json.dumps(animal_rows, default=str), repeats),
+        "new_list_seconds": time_per_call(lambda: serializer.encode_rows(animal_rows), repeats),
+        # The streamed JSON array endpoint before and after, encoding the rows in batches
+        "old_stream_seconds": time_per_call(lambda: [",".join(json.dumps(row, default=str) for row in animal_rows[start:start + batch_size]) for start in range(0, rows, batch_size)], repeats),
+        "new_stream_seconds": time_per_call(lambda: [serializer.encode_rows_chunk(animal_rows[start:start + batch_size], start == 0) for start in range(0, rows, batch_size)], repeats)
+    }
+    results["list_speedup"] = results["old_list_seconds"] / results["new_list_seconds"]
+    results["stream_speedup"] = results["old_stream_seconds"] / results["new_stream_seconds"]
+    return results
+
+# Creating a function that compares the old check_invalid_chars, which compiled its pattern on every call, with the validation module at bulk-import scale
+def benchmark_validation(names, repeats):
+    import re
+    import validation
+
+    # The old check from app.py, copied here so it can still be measured after it was replaced
+    def old_check_invalid_chars(user_input):
+        return bool(re.compile(r'[a-zA-Z]').search(user_input))
+
+    # Mixing mostly valid names with a few that need normalizing and a few that are invalid, like a real import file
+    animal_names = []
+    for number in range(names):
+        if(number % 20 == 0):
+            animal_names.append("  Polar   " + number_to_name(number, prefix=""))
+        elif(number % 25 == 0):
+            animal_names.append(number_to_name(number) + "42")
+        else:
+            animal_names.append(number_to_name(number))
+    results = {
+        "names": names,
+        "old_check_seconds": time_per_call(lambda: [old_check_invalid_chars(name) for name in animal_names], repeats),
+        "validate_name_seconds": time_per_call(lambda: [validation.validate_name(name) for name in animal_names], repeats),
+        "validate_names_seconds": time_per_call(lambda: validation.validate_names(animal_names), repeats)
+    }
+    results["batch_speedup"] = results["old_check_seconds"] / results["validate_names_seconds"]
+    return results
+
+# Creating the command line interface for seeding, running and comparing benchmarks
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test and latency benchmark for the /animals endpoints.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="Fill the animal table of the database in dbcreds with a known number of rows.")
+    seed_parser.add_argument("--rows", type=int, required=True, help="The number of animals to insert, for example 1000, 100000 or 1000000.")
+    seed_parser.add_argument("--reset", action="store_true", help="Delete every existing animal before seeding.")
+
+    run_parser = subparsers.add_parser("run", help="Run a mixed read/write workload against a running server.")
+    run_parser.add_argument("--url", default="http://127.0.0.1:5000", help="The base URL of the running API.")
+    run_parser.add_argument("--concurrency", default="1,8,32", help="A comma-separated list of concurrent client counts.")
+    run_parser.add_argument("--duration", type=float, default=10.0, help="The number of seconds measured at each concurrency level.")
+    run_parser.add_argument("--warmup", type=float, default=2.0, help="The number of seconds of requests to throw away before measuring.")
+    run_parser.add_argument("--read-ratio", type=float, default=0.9, help="The share of requests that are reads, from 0 to 1.")
+    run_parser.add_argument("--page-size", type=int, default=100, help="The limit sent with each GET /animals request.")
+    run_parser.add_argument("--rows", type=int, required=True, help="The number of seeded rows, used to pick pages across the whole table.")
+    run_parser.add_argument("--output", help="The file to write the JSON results to. The results are printed if it is not set.")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files and fail if the new one regressed.")
+    compare_parser.add_argument("old", help="The result file of the baseline run.")
+    compare_parser.add_argument("new", help="The result file of the run to check.")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="The relative change that counts as a regression.")
+
+    serializer_parser = subparsers.add_parser("serializer", help="Compare the old json.dumps path with the serializer module.")
+    serializer_parser.add_argument("--rows", type=int, default=100000, help="The number of animal rows to encode.")
+    serializer_parser.add_argument("--repeats", type=int, default=5, help="The number of timing repeats, of which the fastest is kept.")
+
+    validation_parser = subparsers.add_parser("validation", help="Compare the old animal name check with the validation module.")
+    validation_parser.add_argument("--names", type=int, default=100000, help="The number of animal names to validate.")
+    validation_parser.add_argument("--repeats", type=int, default=5, help="The number of timing repeats, of which the fastest is kept.")
+
+    args = parser.parse_args(argv)
+
+    if(args.command == "seed"):
+        seed_animals(args.rows, args.reset)
+    elif(args.command == "run"):
+        first_id = fetch_first_id(args.url)
+        runs = []
+        for concurrency in [int(level) for level in args.concurrency.split(",")]:
+            run = run_workload(args.url, concurrency, args.duration, args.warmup, args.read_ratio, args.page_size, first_id, args.rows)
+            print(f"concurrency={concurrency} throughput={run['overall']['throughput']:.1f}/s p50={run['overall']['p50_ms']}ms p95={run['overall']['p95_ms']}ms p99={run['overall']['p99_ms']}ms errors={sum(run['errors'].values())}", file=sys.stderr)
+            runs.append(run)
+        results = {
+            "commit": get_git_commit(),
+            "python": platform.python_version(),
+            "url": args.url,
+            "rows": args.rows,
+            "first_id": first_id,
+            "duration": args.duration,
+            "read_ratio": args.read_ratio,
+            "page_size": args.page_size,
+            "runs": runs
+        }
+        if(args.output):
+            with open(args.output, "w") as output_file:
+                json.dump(results, output_file, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+    elif(args.command == "serializer"):
+        print(json.dumps(benchmark_serializer(args.rows, args.repeats), indent=2))
+    elif(args.command == "validation"):
+        print(json.dumps(benchmark_validation(args.names, args.repeats), indent=2))
+    elif(args.command == "compare"):
+        with open(args.old) as old_file, open(args.new) as new_file:
+            regressions = compare_results(json.load(old_file), json.load(new_file), args.threshold)
+        # Exiting with an error code so a regression fails the review check that ran the comparison
+        if(len(regressions) > 0):
+            return 1
+    return 0
+
+if(__name__ == "__main__"):
+    sys.exit(main())
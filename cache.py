@@ -0,0 +1,118 @@
+import collections
+import hashlib
+import settings
+import threading
+import time
+
+# Creating an in-memory cache for built responses that expires entries after a time-to-live and evicts the least recently used entry when it is full
+class ResponseCache:
+    def __init__(self, ttl=30.0, max_entries=128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # The entries are kept in the order they were last used, with the least recently used entry first
+        self.entries = collections.OrderedDict()
+        # The generation goes up on every invalidation so that a response read before a write is never stored after it
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "not_modified": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "stale": 0,
+            "invalidations": 0
+        }
+
+    # Creating a function that returns the cached value and ETag for a key, or None if the key is missing, expired or stored at another version of the data
+    # The version lets a cache that only sees the writes of its own process drop entries that writes made by other processes have made stale
+    def get(self, key, version=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if(entry == None):
+                self.counters["misses"] += 1
+                return None
+            value, etag, stored_at, stored_version = entry
+            # If the entry is older than the time-to-live, remove it and treat it as a miss
+            if(time.monotonic() - stored_at > self.ttl):
+                del self.entries[key]
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return None
+            # If the data has changed since the entry was stored, remove it and treat it as a miss
+            if(stored_version != version):
+                del self.entries[key]
+                self.counters["stale"] += 1
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return value, etag
+
+    # Creating a function that stores a value at a version of the data unless the cache was invalidated since the generation was read
+    def put(self, key, value, etag, generation, version=None):
+        with self.lock:
+            if(generation != self.generation):
+                return False
+            self.entries[key] = (value, etag, time.monotonic(), version)
+            self.entries.move_to_end(key)
+            self.counters["stores"] += 1
+            # Evicting the least recently used entries until the cache fits its size limit
+            while(len(self.entries) > self.max_entries):
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+            return True
+
+    # Creating a function that returns the current generation so it can be passed to put() once the response is built
+    def current_generation(self):
+        with self.lock:
+            return self.generation
+
+    # Creating a function that removes every entry after the data behind the cache has changed
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+            self.counters["invalidations"] += 1
+
+    # Creating a function that counts a conditional request that was answered with 304 Not Modified
+    def record_not_modified(self):
+        with self.lock:
+            self.counters["not_modified"] += 1
+
+    # Creating a function that returns the cache's size and counters
+    def stats(self):
+        with self.lock:
+            cache_stats = dict(self.counters)
+            cache_stats["entries"] = len(self.entries)
+            cache_stats["max_entries"] = self.max_entries
+        return cache_stats
+
+# Creating a function that builds a strong ETag from a response body
+def make_etag(body):
+    if(isinstance(body, str)):
+        body = body.encode("utf-8")
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+# Creating a function that checks whether an If-None-Match header matches an ETag
+def etag_matches(if_none_match, etag):
+    if(if_none_match == None or etag == None):
+        return False
+    if(if_none_match.strip() == "*"):
+        return True
+    # Comparing each ETag in the header, ignoring the weak validator prefix
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if(candidate.startswith("W/")):
+            candidate = candidate[2:]
+        if(candidate == etag):
+            return True
+    return False
+
+# The shared cache for the GET /animals list responses
+animals_cache = ResponseCache(ttl=settings.cache_ttl, max_entries=settings.cache_max_entries)
+
+# Creating a function that returns the animal list cache's statistics
+def get_cache_stats():
+    return animals_cache.stats()
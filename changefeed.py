@@ -0,0 +1,49 @@
+import threading
+
+# This module wakes up the change streams of GET /animals/changes/stream when an animal is written, so the changes are pushed as soon as they commit
+# It only knows about writes made by this process, so the streams also check the database every change_stream_poll_seconds for writes made by other workers
+
+# Creating a notifier that change streams wait on until the next write is committed
+class ChangeNotifier:
+    def __init__(self):
+        # The generation goes up on every committed write, so a stream can tell whether anything was written since it last read the change log
+        self.generation = 0
+        self.condition = threading.Condition()
+        self.counters = {
+            "notifications": 0,
+            "open_streams": 0
+        }
+
+    # Creating a function that returns the current generation, which is read before the change log so no write is missed between the read and the wait
+    def current_generation(self):
+        with self.condition:
+            return self.generation
+
+    # Creating a function that wakes up every waiting stream after a write was committed
+    def notify(self):
+        with self.condition:
+            self.generation += 1
+            self.counters["notifications"] += 1
+            self.condition.notify_all()
+
+    # Creating a function that waits until a write is committed after the given generation, returning False if the timeout ran out first
+    def wait(self, generation, timeout):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.generation != generation, timeout)
+
+    # Creating a function that counts a stream that was opened (1) or closed (-1)
+    def count_stream(self, amount):
+        with self.condition:
+            self.counters["open_streams"] += amount
+
+    # Creating a function that returns the notifier's counters
+    def stats(self):
+        with self.condition:
+            return dict(self.counters)
+
+# The shared notifier for the change streams
+notifier = ChangeNotifier()
+
+# Creating a function that returns the shared notifier's statistics
+def get_change_feed_stats():
+    return notifier.stats()
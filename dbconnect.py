@@ -1,99 +1,529 @@
-import dbcreds
-import mariadb
+import collections
+import contextlib
+import itertools
+import metrics
+import random
+import settings
+import storage
+import threading
+import time
 import traceback
 
-# Creating a function that opens that database connection
-def open_db_connection():
-    # Using a try-except block to catch errors when connecting to the database
+# Creating a function that connects to the database through the storage backend and lets any errors reach the caller
+# The primary is used unless the host and port of a read replica are given
+def connect_to_database(host=None, port=None):
+    with metrics.timed_phase("connect"):
+        return storage.backend.connect(host, port)
+
+# Creating a function that returns a cursor that runs its statement as a prepared statement, letting any errors reach the caller
+# Executing the same statement again on this cursor reuses the prepared statement instead of sending the SQL to be parsed again
+def create_statement_cursor(conn):
+    with metrics.timed_phase("cursor"):
+        return storage.backend.create_statement_cursor(conn)
+
+# Creating a function that returns a cursor that reads its rows from the database as they are fetched instead of all at once, letting any errors reach the caller
+def create_streaming_cursor(conn):
+    with metrics.timed_phase("cursor"):
+        return storage.backend.create_streaming_cursor(conn)
+
+# Creating an exception that is raised when a request can't get a database connection, telling the client how many seconds to wait before trying again
+class DatabaseUnavailableError(Exception):
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Creating an exception that is raised when no connection becomes free before the borrow timeout runs out
+class PoolTimeoutError(DatabaseUnavailableError):
+    pass
+
+# Creating a circuit breaker that stops requests from waiting on a database that keeps failing
+# It is closed while the database works, opens after a number of failures in a row so requests fail right away,
+# and half-opens after a timeout to let a single request find out whether the database is back
+class CircuitBreaker:
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitBreaker.closed
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.is_trial_running = False
+        self.lock = threading.Lock()
+        self.counters = {
+            "opened": 0,
+            "rejected": 0,
+            "failures": 0,
+            "successes": 0
+        }
+
+    # Creating a function that lets a call through or raises DatabaseUnavailableError right away if the breaker is open
+    # It returns True if the call is the single trial call of a half-open breaker
+    def before_call(self):
+        with self.lock:
+            if(self.state == CircuitBreaker.closed):
+                return False
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            # Letting exactly one call try the database once the reset timeout has passed
+            if(remaining <= 0 and not self.is_trial_running):
+                self.state = CircuitBreaker.half_open
+                self.is_trial_running = True
+                return True
+            self.counters["rejected"] += 1
+            raise DatabaseUnavailableError("The database circuit breaker is open.", retry_after=max(remaining, 1.0))
+
+    # Creating a function that records a successful call, closing the breaker
+    def record_success(self):
+        with self.lock:
+            self.counters["successes"] += 1
+            self.consecutive_failures = 0
+            self.state = CircuitBreaker.closed
+            self.is_trial_running = False
+
+    # Creating a function that records a failed call, opening the breaker if the trial call failed or too many calls failed in a row
+    def record_failure(self):
+        with self.lock:
+            self.counters["failures"] += 1
+            self.consecutive_failures += 1
+            self.is_trial_running = False
+            if(self.state == CircuitBreaker.half_open or self.consecutive_failures >= self.failure_threshold):
+                if(self.state != CircuitBreaker.open):
+                    self.counters["opened"] += 1
+                self.state = CircuitBreaker.open
+                self.opened_at = time.monotonic()
+
+    # Creating a function that ends a call that neither succeeded nor failed, such as a read that found every connection busy
+    # If it was the trial call the breaker goes back to open, so the next call can be the trial right away
+    def cancel_call(self, is_trial):
+        with self.lock:
+            if(is_trial):
+                self.is_trial_running = False
+                self.state = CircuitBreaker.open
+
+    # Creating a function that tells whether the breaker is open and still waiting for its reset timeout, without letting a trial call through
+    def is_open(self):
+        with self.lock:
+            return self.state == CircuitBreaker.open and time.monotonic() < self.opened_at + self.reset_timeout
+
+    # Creating a function that returns the breaker's state and counters, with the state as a number so it can be graphed (0 closed, 1 half-open, 2 open)
+    def stats(self):
+        with self.lock:
+            breaker_stats = dict(self.counters)
+            breaker_stats["state"] = {CircuitBreaker.closed: 0, CircuitBreaker.half_open: 1, CircuitBreaker.open: 2}[self.state]
+            breaker_stats["consecutive_failures"] = self.consecutive_failures
+        return breaker_stats
+
+# Creating a function that calls a function again when it fails with a temporary OperationalError, waiting a random, growing delay between attempts until the deadline passes
+def retry_with_backoff(function, deadline, base_delay, max_delay):
+    stop_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        try:
+            return function()
+        except storage.backend.OperationalError:
+            # Picking the delay at random below a limit that doubles each attempt, so many workers retrying at once don't all hit the database together
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            if(time.monotonic() + delay >= stop_at):
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+# Creating a function that connects to the database through a circuit breaker, retrying temporary failures while the breaker is closed
+# The retry deadline defaults to the connect_retry_deadline setting, and a deadline of 0 makes a single attempt
+def connect_through_breaker(breaker, connect=connect_to_database, retry_deadline=None):
+    if(retry_deadline == None):
+        retry_deadline = settings.connect_retry_deadline
+    is_trial = breaker.before_call()
+    # Using a try-except block to turn connection failures into a DatabaseUnavailableError the handlers can answer with 503
     try:
-        # Trying to return the connection object to the caller
-        return mariadb.connect(user=dbcreds.user, password=dbcreds.password, host=dbcreds.host, port=dbcreds.port, database=dbcreds.database)
-    # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
-    except mariadb.OperationalError:
-        print("Operational errors detected in the database connection.")
-        traceback.print_exc()
-    # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
-    except mariadb.DatabaseError:
-        # A DatabaseError exception is raised for all errors that are related to the database
-        print("Error detected in the database and resulted in a connection failure.")
-        traceback.print_exc()
-    # Raising a general exception to catch all other errors, printing a general error message and the traceback
-    except:
-        print("An error has occured. Failed to connect to the database.")
-        traceback.print_exc()
-
-# Creating a function that returns a cursor object using the current connection, which is passed as an argument
-def create_db_cursor(conn):
-    # Using a try-except block to catch errors when creating a cursor
+        # The half-open trial call gets a single attempt so a database that is still down doesn't hold it for the whole retry deadline
+        if(is_trial):
+            conn = connect()
+        else:
+            conn = retry_with_backoff(connect, retry_deadline, settings.connect_retry_base_delay, settings.connect_retry_max_delay)
+    except storage.backend.Error as error:
+        breaker.record_failure()
+        raise DatabaseUnavailableError(f"Failed to connect to the database: {error}", retry_after=breaker.reset_timeout) from error
+    except BaseException:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return conn
+
+# The functions called with every connection a pool closes, so a module that keeps something for each connection can let go of it
+# animaldb closes the prepared statement cursors of the connection here, since the cursors would otherwise keep the closed connection in memory
+connection_close_hooks = []
+
+# Creating a function that runs the close hooks for a connection, printing any error so that one failing hook never stops the connection from being closed
+def run_connection_close_hooks(conn):
+    for hook in connection_close_hooks:
+        try:
+            hook(conn)
+        except Exception:
+            print("An error has occured while cleaning up a closed database connection.")
+            traceback.print_exc()
+
+# Creating a pool that keeps database connections open between requests so each request does not pay for a new connection
+class ConnectionPool:
+    def __init__(self, connect, min_size=1, max_size=10, idle_timeout=300.0, borrow_timeout=5.0, health_check=True):
+        # If the pool sizes don't make sense, refuse to create the pool
+        if(min_size < 0 or max_size < 1 or min_size > max_size):
+            raise ValueError("The pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1.")
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.borrow_timeout = borrow_timeout
+        self.health_check = health_check
+        # The idle connections are stored with the time they were returned so that old ones can be evicted
+        self.idle_connections = collections.deque()
+        self.in_use_count = 0
+        # The condition is used both as a lock and to wake up requests that are waiting for a free connection
+        self.condition = threading.Condition()
+        self.counters = {
+            "created": 0,
+            "closed": 0,
+            "borrowed": 0,
+            "returned": 0,
+            "health_check_failures": 0,
+            "idle_evictions": 0,
+            "borrow_timeouts": 0,
+            "connect_failures": 0
+        }
+
+    # Creating a function that borrows a connection from the pool, opening a new one if the pool has room for it
+    def borrow(self, timeout=None):
+        if(timeout == None):
+            timeout = self.borrow_timeout
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                self.evict_idle_connections()
+                # Taking the most recently returned connection so that the least used ones can age out of the pool
+                if(len(self.idle_connections) > 0):
+                    conn = self.idle_connections.pop()[0]
+                    break
+                # If every connection is in use but the pool has room for another one, open a new one outside of the lock
+                if(self.in_use_count < self.max_size):
+                    conn = None
+                    break
+                # Waiting for another request to return a connection until the borrow timeout runs out
+                remaining = deadline - time.monotonic()
+                if(remaining <= 0):
+                    self.counters["borrow_timeouts"] += 1
+                    raise PoolTimeoutError(f"No database connection became free within {timeout} seconds.")
+                self.condition.wait(remaining)
+            self.in_use_count += 1
+            self.counters["borrowed"] += 1
+        # Checking that the idle connection still works before handing it out, replacing it if it doesn't
+        if(conn != None and self.health_check and not self.is_healthy(conn)):
+            with self.condition:
+                self.counters["health_check_failures"] += 1
+            self.close_connection(conn)
+            conn = None
+        if(conn == None):
+            conn = self.create_connection()
+        return conn
+
+    # Creating a function that gives a borrowed connection back to the pool
+    def give_back(self, conn, broken=False):
+        # Rolling back anything the request did not commit so the next request starts with a clean connection
+        if(not broken):
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        if(broken):
+            self.close_connection(conn)
+        with self.condition:
+            self.in_use_count -= 1
+            self.counters["returned"] += 1
+            if(not broken):
+                self.idle_connections.append((conn, time.monotonic()))
+            self.condition.notify()
+
+    # Creating a function that opens a new connection for a request that has already reserved a spot in the pool
+    def create_connection(self):
+        try:
+            conn = self.connect()
+        except BaseException:
+            # Giving the reserved spot back so another request can try to connect
+            with self.condition:
+                self.in_use_count -= 1
+                self.counters["connect_failures"] += 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.counters["created"] += 1
+        return conn
+
+    # Creating a function that checks whether a connection can still talk to the database
+    def is_healthy(self, conn):
+        try:
+            storage.backend.ping(conn)
+            return True
+        except Exception:
+            return False
+
+    # Creating a function that closes a connection that is leaving the pool
+    def close_connection(self, conn):
+        run_connection_close_hooks(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self.condition:
+            self.counters["closed"] += 1
+
+    # Creating a function that closes connections that have been idle for too long, keeping at least the minimum number of connections open
+    # This function must be called while holding the pool's lock
+    def evict_idle_connections(self):
+        now = time.monotonic()
+        # The oldest idle connections are on the left side of the deque
+        while(len(self.idle_connections) > 0 and len(self.idle_connections) + self.in_use_count > self.min_size):
+            conn, returned_at = self.idle_connections[0]
+            if(now - returned_at < self.idle_timeout):
+                break
+            self.idle_connections.popleft()
+            self.counters["idle_evictions"] += 1
+            self.counters["closed"] += 1
+            run_connection_close_hooks(conn)
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    # Creating a function that opens connections until the pool has its minimum number of connections
+    def fill_to_min_size(self):
+        while True:
+            with self.condition:
+                if(len(self.idle_connections) + self.in_use_count >= self.min_size):
+                    return
+                self.in_use_count += 1
+            conn = self.create_connection()
+            with self.condition:
+                self.in_use_count -= 1
+                self.idle_connections.append((conn, time.monotonic()))
+                self.condition.notify()
+
+    # Creating a function that returns the pool's current size and counters
+    def stats(self):
+        with self.condition:
+            pool_stats = dict(self.counters)
+            pool_stats["idle"] = len(self.idle_connections)
+            pool_stats["in_use"] = self.in_use_count
+            pool_stats["min_size"] = self.min_size
+            pool_stats["max_size"] = self.max_size
+        return pool_stats
+
+# The circuit breaker that guards every new connection to the database
+db_breaker = CircuitBreaker(failure_threshold=settings.breaker_failure_threshold, reset_timeout=settings.breaker_reset_timeout)
+
+# The pool is created the first time it is needed so that importing this module does not connect to the database
+db_pool = None
+db_pool_lock = threading.Lock()
+
+# Creating a function that returns the shared connection pool, creating it from the settings on the first call
+def get_db_pool():
+    global db_pool
+    with db_pool_lock:
+        if(db_pool == None):
+            # Keeping within the number of connections the backend can have open at once
+            max_size = settings.pool_max_size
+            if(storage.backend.max_connections != None):
+                max_size = min(max_size, storage.backend.max_connections)
+            db_pool = ConnectionPool(lambda: connect_through_breaker(db_breaker), min_size=min(settings.pool_min_size, max_size), max_size=max_size, idle_timeout=settings.pool_idle_timeout, borrow_timeout=settings.pool_borrow_timeout, health_check=settings.pool_health_check)
+            # Opening the minimum number of connections up front, but still creating the pool if the database is down
+            try:
+                db_pool.fill_to_min_size()
+            except Exception:
+                print("Failed to open the minimum number of pooled database connections.")
+                traceback.print_exc()
+        return db_pool
+
+# Creating a context manager that borrows a connection from the shared pool and returns it to the pool afterwards instead of closing it
+# If no connection can be borrowed it raises DatabaseUnavailableError, which the app answers with 503 Service Unavailable instead of going on without a connection
+@contextlib.contextmanager
+def pooled_db_connection():
+    pool = get_db_pool()
+    # Using a try-except block to print why a connection could not be borrowed before letting the error reach the caller
     try:
-        # Trying to return a cursor object using the current connection
-        return conn.cursor()
-    # Raising an InternalError exception if the cursor is invalid
-    except mariadb.InternalError:
-        print("Internal errors detected in the database. Failed to create a cursor.")
-        traceback.print_exc()
-    # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
-    except mariadb.OperationalError:
-        print("Operational errors detected in the database connection. Failed to create a cursor.")
-        traceback.print_exc()
-    # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
-    except mariadb.DatabaseError:
-        print("Errors detected in database. Failed to create a cursor.")
-        traceback.print_exc()
-    # Raising a general exception to catch all other errors, printing a general error message and the traceback
-    except:
-        print("An error has occured. Failed to create a cursor.")
-        traceback.print_exc()
-
-# Creating a function that closes the cursor
-def close_cursor(cursor):
-    # Checking to see if the cursor was initially created and if it wasn't, don't attempt to close the cursor
-    if(cursor == None):
-        return True
-    # Using a try-except block to catch errors when closing the cursor
+        with metrics.timed_phase("borrow"):
+            conn = pool.borrow()
+    # Raising the PoolTimeoutError exception if every connection stayed in use for the whole borrow timeout
+    except PoolTimeoutError:
+        print("Timed out waiting for a free database connection.")
+        raise
+    # Raising the DatabaseUnavailableError exception if the database could not be reached or the circuit breaker is open
+    except DatabaseUnavailableError as error:
+        print(f"The database is unavailable. {error}")
+        raise
+    # Handing the connection to the caller and always giving it back to the pool afterwards
     try:
-        # Trying to close the cursor, returning "True" to indicate that the cursor was closed successfully
-        cursor.close()
-        return True
-    # Raising an InternalError exception if the cursor is invalid
-    except mariadb.InternalError:
-        print("Internal errors detected in the database. Failed to create a cursor.")
-        traceback.print_exc()
-    # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
-    except mariadb.OperationalError:
-        print("Operational errors detected in the database connection. Failed to create a cursor.")
-        traceback.print_exc()
-    # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
-    except mariadb.DatabaseError:
-        # A DatabaseError exception is raised for all errors that are related to the database
-        print("Errors detected with the current connection. Failed to close cursor.")
-        traceback.print_exc()
-    # Raising a general exception to catch all other errors, printing a general error message and the traceback
-    except:
-        print("An error has occured. Failed to close cursor.")
-        traceback.print_exc()
-        return False
-
-# Creating a function that closes the database connection
-def close_db_connection(conn):
-    # If the database connect was not initially opened, don't attempt to close it
-    if(conn == None):
-        return True
-    # Using a try-except block to catch errors when closing the database connection
+        yield conn
+    finally:
+        with metrics.timed_phase("give_back"):
+            pool.give_back(conn)
+
+# Creating a read replica, which has a connection pool and a circuit breaker of its own
+# The breaker counts whole reads, so a replica is ejected when it can't be connected to and also when it accepts connections but its queries fail
+# It lets one read try the replica again after replica_eject_seconds
+class ReplicaNode:
+    def __init__(self, host, port):
+        self.name = f"{host}:{port}"
+        self.breaker = CircuitBreaker(failure_threshold=settings.replica_failure_threshold, reset_timeout=settings.replica_eject_seconds)
+        # A replica gets a single connection attempt because a read can go to another replica or the primary instead of waiting for it
+        # The pool connects without going through the breaker, since a connection that works followed by a query that fails is still a failed read
+        self.pool = ConnectionPool(lambda: connect_to_database(host, port), min_size=settings.pool_min_size, max_size=settings.pool_max_size, idle_timeout=settings.pool_idle_timeout, borrow_timeout=settings.pool_borrow_timeout, health_check=settings.pool_health_check)
+
+# Creating a function that splits a host:port address into its host and port, using the primary's port if the address has none
+def parse_address(address):
+    host, separator, port = address.rpartition(":")
+    if(separator == ""):
+        return address, storage.backend.default_port
+    return host, int(port)
+
+# The read replicas are created the first time a read needs them, just like the primary's pool
+replica_nodes = None
+# Counting the reads so that replicas with the same load take turns
+replica_turns = itertools.count()
+# The number of reads sent to the primary and to the replicas, and the number of times a replica could not be used and the read moved on
+read_route_counters = {
+    "primary_reads": 0,
+    "replica_reads": 0,
+    "replica_fallbacks": 0
+}
+read_route_lock = threading.Lock()
+# The replica connections that are lent out to reads, each with whether one of its queries failed with an OperationalError
+# The handlers catch query errors themselves, so animaldb reports them here for pooled_read_connection to see once the read is over
+replica_read_failures = {}
+
+# Creating a function that returns the read replicas from the settings, creating their pools on the first call
+def get_replica_nodes():
+    global replica_nodes
+    with db_pool_lock:
+        if(replica_nodes == None):
+            replica_nodes = []
+            if(len(settings.replica_hosts) > 0 and not storage.backend.supports_replicas):
+                print(f"The {storage.backend.name} storage backend has no read replicas, so every read goes to the primary.")
+            elif(len(settings.replica_hosts) > 0):
+                replica_nodes = [ReplicaNode(*parse_address(address)) for address in settings.replica_hosts]
+            for node in replica_nodes:
+                # Opening the minimum number of connections up front, which ejects a replica that is already down
+                try:
+                    node.pool.fill_to_min_size()
+                except Exception:
+                    print(f"Failed to open the minimum number of pooled connections to read replica {node.name}.")
+                    traceback.print_exc()
+                    node.breaker.record_failure()
+        return replica_nodes
+
+# Creating a function that returns the replicas that can take a read, least loaded first, with replicas of the same load taking turns
+def choose_replicas():
+    nodes = [node for node in get_replica_nodes() if not node.breaker.is_open()]
+    if(len(nodes) == 0):
+        return nodes
+    turn = next(replica_turns) % len(nodes)
+    nodes = nodes[turn:] + nodes[:turn]
+    # Sorting keeps the turn order between replicas with the same number of borrowed connections
+    return sorted(nodes, key=lambda node: node.pool.in_use_count)
+
+# Creating a function that adds one to a read route counter
+def count_read_route(name):
+    with read_route_lock:
+        read_route_counters[name] += 1
+
+# Creating a function that tells pooled_read_connection that a query failed on a connection, so a replica whose queries fail is ejected like one that can't be reached
+# Only an OperationalError counts, since the other errors come from the query rather than from the replica
+def report_query_error(conn, error):
+    if(not isinstance(error, storage.backend.OperationalError)):
+        return
+    with read_route_lock:
+        if(conn in replica_read_failures):
+            replica_read_failures[conn] = True
+
+# Creating a function that borrows a connection from a read replica for one read, returning None if the read has to go somewhere else
+# It returns the connection and whether the read is the trial read of an ejected replica
+def borrow_replica_connection(node):
+    is_trial = node.breaker.before_call()
+    # Using a try-except block to count a replica that can't be connected to against its breaker
+    try:
+        with metrics.timed_phase("borrow"):
+            conn = node.pool.borrow()
+    # Raising the PoolTimeoutError exception if every connection to the replica is busy, which says nothing about whether the replica works
+    except PoolTimeoutError:
+        node.breaker.cancel_call(is_trial)
+        raise
+    except storage.backend.Error as error:
+        node.breaker.record_failure()
+        raise DatabaseUnavailableError(f"Failed to connect to read replica {node.name}: {error}", retry_after=node.breaker.reset_timeout) from error
+    except BaseException:
+        node.breaker.cancel_call(is_trial)
+        raise
+    return conn, is_trial
+
+# Creating a context manager that borrows a connection for a read, from a read replica when there is one that works and from the primary otherwise
+# Passing use_primary=True reads from the primary, which the app does right after a client's own write so the client never reads data older than its write
+@contextlib.contextmanager
+def pooled_read_connection(use_primary=False):
+    node = None
+    if(not use_primary):
+        for candidate in choose_replicas():
+            # Using a try-except block to move on to the next replica, and finally the primary, if a replica is down or all of its connections are busy
+            try:
+                conn, is_trial = borrow_replica_connection(candidate)
+                node = candidate
+                break
+            except DatabaseUnavailableError as error:
+                print(f"Read replica {candidate.name} is unavailable. {error}")
+                count_read_route("replica_fallbacks")
+    if(node == None):
+        count_read_route("primary_reads")
+        with pooled_db_connection() as conn:
+            yield conn
+        return
+    count_read_route("replica_reads")
+    with read_route_lock:
+        replica_read_failures[conn] = False
+    is_failed = False
+    is_finished = False
+    # Handing the connection to the caller and always giving it back to the replica's pool afterwards
     try:
-        # Trying to close the connection, returning "True" to indicate that the connection was close successfully
-        conn.close()
-        return True
-    # Raising the OperationalError exception for things that are not in control of the programmer, printing an error message and the traceback
-    except mariadb.OperationalError:
-        print("Optional errors detected in the database. Failed to close the connection.")
-        traceback.print_exc()
-    # Raising the DatabaseError exception for errors related to the database, printing an error message and the traceback
-    except mariadb.DatabaseError:
-        print("Errored detected in the database. Failed to close the connection.")
-        traceback.print_exc()
-    # Raising a general exception to catch all other errors, printing a general error message and the traceback
-    except:
-        print("An error has occured. Failed to close database connection.")
-        traceback.print_exc()
-        return False
\ No newline at end of file
+        yield conn
+        is_finished = True
+    # Raising the OperationalError exception again after counting it, if the caller did not catch it
+    except storage.backend.OperationalError:
+        is_failed = True
+        raise
+    finally:
+        with read_route_lock:
+            is_failed = replica_read_failures.pop(conn) or is_failed
+        # A failed read counts against the replica and its connection is closed, while a read cut short by another error neither counts for nor against it
+        if(is_failed):
+            print(f"A query failed on read replica {node.name}.")
+            node.breaker.record_failure()
+        elif(is_finished):
+            node.breaker.record_success()
+        else:
+            node.breaker.cancel_call(is_trial)
+        with metrics.timed_phase("give_back"):
+            node.pool.give_back(conn, broken=is_failed)
+
+# Creating a function that returns the shared pool's statistics
+def get_pool_stats():
+    return get_db_pool().stats()
+
+# Creating a function that returns the circuit breaker's statistics
+def get_breaker_stats():
+    return db_breaker.stats()
+
+# Creating a function that returns the number of reads sent to the primary and to the replicas
+def get_read_route_stats():
+    with read_route_lock:
+        return dict(read_route_counters)
+
+# Creating a function that returns the name, pool statistics and breaker statistics of every read replica
+def get_replica_stats():
+    return [(node.name, node.pool.stats(), node.breaker.stats()) for node in get_replica_nodes()]
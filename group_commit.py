@@ -0,0 +1,136 @@
+import animaldb
+import cache
+import changefeed
+import concurrent.futures
+import dbconnect
+import queue
+import settings
+import storage
+import threading
+import time
+import traceback
+
+# Creating an exception that is raised when a write timed out after the writer had already started its batch
+# The batch may still commit after the caller stopped waiting, so the client is told the write may have been applied
+class WriteTimeoutError(Exception):
+    pass
+
+# Creating a writer that collects writes from many requests and applies them in one transaction, so concurrent writers share one commit instead of paying for one each
+class GroupCommitWriter:
+    def __init__(self, max_batch_size=100, linger_seconds=0.002):
+        self.max_batch_size = max_batch_size
+        self.linger_seconds = linger_seconds
+        self.queue = queue.Queue()
+        # The background thread is started by the first write, so a forking server starts one in each worker process
+        self.thread = None
+        self.lock = threading.Lock()
+        self.counters = {
+            "writes": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "largest_batch": 0,
+            "timeouts": 0
+        }
+
+    # Creating a function that queues a write and waits for the result of its batch
+    # The write function receives the batch's connection and the arguments, and its return value or IntegrityError is handed back to this caller only
+    def submit(self, write_function, *args, timeout=None):
+        self.start()
+        future = concurrent.futures.Future()
+        self.queue.put((write_function, args, future))
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            with self.lock:
+                self.counters["timeouts"] += 1
+            # Cancelling the write if the writer has not taken it into a batch yet, so it is never applied and the client can safely send it again
+            if(future.cancel()):
+                raise dbconnect.DatabaseUnavailableError("The write timed out waiting for the group commit writer and was not applied.")
+            raise WriteTimeoutError("The write timed out while its batch was being committed and may still be applied.")
+
+    # Creating a function that starts the background thread if it isn't running yet
+    def start(self):
+        with self.lock:
+            if(self.thread == None or not self.thread.is_alive()):
+                self.thread = threading.Thread(target=self.run, name="group-commit-writer", daemon=True)
+                self.thread.start()
+
+    # Creating a function that keeps applying batches for as long as the process runs
+    def run(self):
+        while True:
+            batch = self.collect_batch()
+            # Catching everything so that one bad batch never stops the writer thread
+            try:
+                self.apply_batch(batch)
+            except BaseException as error:
+                print("An error has occured in the group commit writer.")
+                traceback.print_exc()
+                with self.lock:
+                    self.counters["failed_batches"] += 1
+                for write_function, args, future in batch:
+                    if(not future.done()):
+                        future.set_exception(error)
+
+    # Creating a function that waits for a write and then gathers more writes until the batch is full or the linger time has passed
+    def collect_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.linger_seconds
+        while(len(batch) < self.max_batch_size):
+            remaining = deadline - time.monotonic()
+            # Taking any writes that are already waiting even when the linger time is over
+            try:
+                if(remaining <= 0):
+                    batch.append(self.queue.get_nowait())
+                else:
+                    batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    # Creating a function that runs every write of a batch on one connection and commits them together
+    # The cached animal lists are cleared and the change streams are woken here, right after the commit, so it also happens for writes whose callers timed out
+    def apply_batch(self, batch):
+        # Leaving out the writes that were cancelled after their callers timed out, and marking the rest as running so they can no longer be cancelled
+        batch = [(write_function, args, future) for write_function, args, future in batch if future.set_running_or_notify_cancel()]
+        if(len(batch) == 0):
+            return
+        results = []
+        with dbconnect.pooled_db_connection() as conn:
+            with animaldb.write_transaction(conn):
+                for write_function, args, future in batch:
+                    # A unique key failure only undoes its own statement, so it is reported to its own request and the rest of the batch goes on
+                    try:
+                        results.append((future, write_function(conn, *args), None))
+                    except storage.backend.IntegrityError as error:
+                        results.append((future, None, error))
+        # Clearing the cached animal lists now that the table has changed, and pushing the changes to the open change streams
+        cache.animals_cache.invalidate()
+        changefeed.notifier.notify()
+        # Handing each request its own result only after the whole batch was committed
+        for future, result, error in results:
+            if(error != None):
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        with self.lock:
+            self.counters["writes"] += len(batch)
+            self.counters["batches"] += 1
+            self.counters["largest_batch"] = max(self.counters["largest_batch"], len(batch))
+
+    # Creating a function that returns the writer's counters and the number of writes waiting in the queue
+    def stats(self):
+        with self.lock:
+            writer_stats = dict(self.counters)
+        writer_stats["queued"] = self.queue.qsize()
+        return writer_stats
+
+# The shared writer for the single-animal write endpoints
+writer = GroupCommitWriter(max_batch_size=settings.group_commit_max_batch, linger_seconds=settings.group_commit_linger_ms / 1000)
+
+# Creating a function that queues a write on the shared writer and waits for its result
+def submit_write(write_function, *args):
+    return writer.submit(write_function, *args, timeout=settings.group_commit_timeout)
+
+# Creating a function that returns the shared writer's statistics
+def get_group_commit_stats():
+    return writer.stats()
@@ -0,0 +1,144 @@
+import bisect
+import contextlib
+import threading
+import time
+
+# The upper bounds in seconds of the latency histogram buckets, from a tenth of a millisecond up to ten seconds
+default_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Creating a histogram that counts observations into fixed buckets, keeping one set of buckets for each combination of label values
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=default_buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # Each series stores the count for every bucket, the sum of the observations and the number of observations
+        self.series = {}
+        self.lock = threading.Lock()
+
+    # Creating a function that adds one observation to the series with the given label values
+    def observe(self, label_values, value):
+        # Finding the bucket before taking the lock so the lock is held as briefly as possible
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if(series == None):
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bucket_index] += 1
+            series[1] += value
+            series[2] += 1
+
+    # Creating a function that returns the histogram in the Prometheus text format
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series_list = [(label_values, list(series[0]), series[1], series[2]) for label_values, series in sorted(self.series.items())]
+        for label_values, bucket_counts, total, count in series_list:
+            labels = format_labels(self.label_names, label_values)
+            # Prometheus buckets are cumulative, so each bucket also counts every observation in the smaller buckets
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative_count += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names + ('le',), label_values + (repr(upper_bound),))} {cumulative_count}")
+            lines.append(f"{self.name}_bucket{format_labels(self.label_names + ('le',), label_values + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+# Creating a counter that only goes up, keeping one value for each combination of label values
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+    # Creating a function that adds an amount to the series with the given label values
+    def increment(self, label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    # Creating a function that returns the counter in the Prometheus text format
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            values = sorted(self.values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+# Creating a function that formats label names and values the way Prometheus expects them
+def format_labels(label_names, label_values):
+    if(len(label_names) == 0):
+        return ""
+    escaped_values = [str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in label_values]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(label_names, escaped_values)) + "}"
+
+# Creating a function that tells whether a statistic is a number that can be exported as a gauge
+def is_gauge_value(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+# Creating a function that formats a dictionary of numbers as Prometheus gauges, skipping values that are not numbers
+def render_gauges(prefix, help_text, values):
+    lines = []
+    for key, value in sorted(values.items()):
+        if(not is_gauge_value(value)):
+            continue
+        name = f"{prefix}_{key}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return lines
+
+# Creating a function that formats a dictionary of numbers for each set of label values as Prometheus gauges, skipping values that are not numbers
+# The same key of every dictionary goes into one metric family with a series per set of label values, so the series can be added up and compared
+def render_labeled_gauges(prefix, help_text, label_names, labeled_values):
+    lines = []
+    keys = sorted(set(key for label_values, values in labeled_values for key, value in values.items() if is_gauge_value(value)))
+    for key in keys:
+        name = f"{prefix}_{key}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for label_values, values in labeled_values:
+            if(is_gauge_value(values.get(key))):
+                lines.append(f"{name}{format_labels(label_names, label_values)} {values[key]}")
+    return lines
+
+# The time spent in each phase of talking to the database or building a response
+phase_seconds = Histogram("animals_phase_duration_seconds", "Time spent in each phase of handling a request.", ("phase",))
+# The errors raised in each phase, by the exception class that was raised
+phase_errors = Counter("animals_phase_errors_total", "Errors raised in each phase of handling a request, by exception class.", ("phase", "exception"))
+# The time taken by each request, by route and method
+request_seconds = Histogram("animals_http_request_duration_seconds", "Time taken to handle each HTTP request.", ("route", "method"))
+# The number of responses sent, by route, method and status code
+responses_total = Counter("animals_http_responses_total", "HTTP responses sent, by route, method and status code.", ("route", "method", "status"))
+
+# Creating a context manager that times one phase and counts the exception class of any error raised inside it
+@contextlib.contextmanager
+def timed_phase(phase):
+    started_at = time.perf_counter()
+    try:
+        yield
+    except Exception as error:
+        phase_errors.increment((phase, type(error).__module__ + "." + type(error).__name__))
+        raise
+    finally:
+        phase_seconds.observe((phase,), time.perf_counter() - started_at)
+
+# Creating a function that records a finished HTTP request
+def observe_request(route, method, status, seconds):
+    request_seconds.observe((route, method), seconds)
+    responses_total.increment((route, method, str(status)))
+
+# Creating a function that returns every metric in the Prometheus text format, followed by any extra gauges and labeled gauges
+def render(extra_gauges=(), labeled_gauges=()):
+    lines = []
+    for metric in (request_seconds, responses_total, phase_seconds, phase_errors):
+        lines.extend(metric.render())
+    for prefix, help_text, values in extra_gauges:
+        lines.extend(render_gauges(prefix, help_text, values))
+    for prefix, help_text, label_names, labeled_values in labeled_gauges:
+        lines.extend(render_labeled_gauges(prefix, help_text, label_names, labeled_values))
+    return "\n".join(lines) + "\n"
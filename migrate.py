@@ -0,0 +1,112 @@
+import animaldb
+import dbconnect
+import os
+import storage
+import sys
+import traceback
+
+# This script applies the SQL files in the migrations folder in order and checks that the animal searches use their indexes
+# The migrations are written for MariaDB, while the SQLite backend creates its whole schema itself when it connects
+#   python migrate.py apply         applies every migration that has not been applied yet
+#   python migrate.py check-plans   fails if a search query could only run as a full table scan
+
+# The folder that holds the migrations, which are applied in the order of their file names
+migrations_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# A sample value for each kind of search, used to ask the database how it would run the query
+sample_searches = {
+    "name": "Lion",
+    "prefix": animaldb.make_prefix_pattern("Li"),
+    "q": animaldb.make_fulltext_query("lion")
+}
+
+# Creating a function that splits a migration file into its statements, leaving out the comment lines
+def read_statements(path):
+    with open(path) as migration_file:
+        lines = [line for line in migration_file.read().splitlines() if not line.strip().startswith("--")]
+    return [statement.strip() for statement in "\n".join(lines).split(";") if statement.strip() != ""]
+
+# Creating a function that applies every migration that has not been applied yet and returns the names of the migrations it applied
+def apply_migrations(conn):
+    cursor = conn.cursor()
+    applied_now = []
+    try:
+        # Keeping track of the applied migrations in the database itself so each one runs only once
+        cursor.execute("CREATE TABLE IF NOT EXISTS schema_migration (name VARCHAR(255) PRIMARY KEY, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        cursor.execute("SELECT name FROM schema_migration")
+        already_applied = set(row[0] for row in cursor.fetchall())
+        for file_name in sorted(os.listdir(migrations_folder)):
+            if(not file_name.endswith(".sql") or file_name in already_applied):
+                continue
+            for statement in read_statements(os.path.join(migrations_folder, file_name)):
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migration(name) VALUES(?)", [file_name,])
+            conn.commit()
+            applied_now.append(file_name)
+            print(f"Applied {file_name}.")
+    finally:
+        cursor.close()
+    return applied_now
+
+# Creating a function that runs EXPLAIN QUERY PLAN on every kind of search with SQLite and returns a list of problems, which is empty if no search reads the whole animal table
+def check_sqlite_query_plans(conn):
+    problems = []
+    for kind, value in sample_searches.items():
+        sql, params = animaldb.build_select_animals_query(0, 100, (kind, value))
+        details = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+        if(any(detail.startswith("SCAN animal ") or detail == "SCAN animal" for detail in details)):
+            problems.append(f"The {kind} search reads the whole animal table ({'; '.join(details)}).")
+        else:
+            print(f"The {kind} search runs as {'; '.join(details)}.")
+    return problems
+
+# Creating a function that runs EXPLAIN on every kind of search and returns a list of problems, which is empty if every search can use an index on name
+def check_query_plans(conn):
+    if(storage.backend.name == "sqlite"):
+        return check_sqlite_query_plans(conn)
+    problems = []
+    cursor = conn.cursor()
+    try:
+        for kind, value in sample_searches.items():
+            sql, params = animaldb.build_select_animals_query(0, 100, (kind, value))
+            cursor.execute("EXPLAIN " + sql, params)
+            column_names = [column[0].lower() for column in cursor.description]
+            for row in cursor.fetchall():
+                plan = dict(zip(column_names, row))
+                # The primary key only helps with the id range, so the search needs another index to avoid reading every row
+                possible_keys = [key.strip() for key in (plan.get("possible_keys") or "").split(",") if key.strip() != ""]
+                name_keys = [key for key in possible_keys if key != "PRIMARY"]
+                if(len(name_keys) == 0):
+                    problems.append(f"The {kind} search has no index on name to use (possible_keys={plan.get('possible_keys')}, type={plan.get('type')}).")
+                else:
+                    print(f"The {kind} search can use {', '.join(name_keys)} (chosen key={plan.get('key')}, type={plan.get('type')}).")
+    finally:
+        cursor.close()
+    return problems
+
+# Creating the command line interface for applying migrations and checking the query plans
+def main(argv):
+    if(len(argv) != 1 or argv[0] not in ("apply", "check-plans")):
+        print("Usage: python migrate.py apply|check-plans")
+        return 2
+    conn = dbconnect.connect_to_database()
+    try:
+        if(argv[0] == "apply"):
+            if(storage.backend.name == "sqlite"):
+                print("The SQLite backend created its schema when it connected, so there are no migrations to apply.")
+                return 0
+            apply_migrations(conn)
+            return 0
+        problems = check_query_plans(conn)
+        for problem in problems:
+            print(problem)
+        # Exiting with an error code so a missing index fails the check that ran this script
+        return 1 if len(problems) > 0 else 0
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        conn.close()
+
+if(__name__ == "__main__"):
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,23 @@
+-- Adding the indexes that the name, prefix and q searches of GET /animals rely on, so they run as index seeks instead of full table scans
+-- The name column is already expected to be unique, since creating a duplicate animal fails with an IntegrityError
+
+-- The unique index on name serves exact name lookups (name = ?) and prefix searches (name LIKE 'prefix%')
+-- It is only added if the table has no unique index on name alone yet, whatever that index is called, since a second one would only slow down every write
+-- IF NOT EXISTS only compares index names, so the check looks the existing indexes up in information_schema instead
+SET @add_name_unique_index = (
+    SELECT IF(COUNT(*) = 0, 'ALTER TABLE animal ADD UNIQUE INDEX animal_name_unique (name)', 'DO 0')
+    FROM information_schema.STATISTICS AS name_index
+    WHERE name_index.TABLE_SCHEMA = DATABASE() AND name_index.TABLE_NAME = 'animal' AND name_index.NON_UNIQUE = 0 AND name_index.COLUMN_NAME = 'name' AND name_index.SEQ_IN_INDEX = 1
+    AND NOT EXISTS (
+        SELECT 1 FROM information_schema.STATISTICS AS other_column
+        WHERE other_column.TABLE_SCHEMA = name_index.TABLE_SCHEMA AND other_column.TABLE_NAME = name_index.TABLE_NAME AND other_column.INDEX_NAME = name_index.INDEX_NAME AND other_column.SEQ_IN_INDEX = 2
+    )
+);
+PREPARE add_name_unique_index FROM @add_name_unique_index;
+EXECUTE add_name_unique_index;
+DEALLOCATE PREPARE add_name_unique_index;
+
+-- The FULLTEXT index serves word searches (MATCH(name) AGAINST(? IN BOOLEAN MODE))
+-- InnoDB only indexes words of at least innodb_ft_min_token_size characters, which is 3 by default
+-- IF NOT EXISTS keeps this statement safe to run again, since no other migration adds a FULLTEXT index on name
+ALTER TABLE animal ADD FULLTEXT INDEX IF NOT EXISTS animal_name_fulltext (name);
@@ -0,0 +1,18 @@
+-- Adding the change log behind GET /animals/changes, so clients can fetch only what changed since the last version they saw instead of the whole list
+-- Every create, edit and delete adds one row, and the version numbers are handed out from the single row of animal_change_version in the same transaction
+-- Taking the version from that row locks it until the transaction commits, so versions become visible in order and a client never skips a change that commits late
+
+CREATE TABLE IF NOT EXISTS animal_change (
+    version BIGINT UNSIGNED NOT NULL PRIMARY KEY,
+    operation VARCHAR(6) NOT NULL,
+    animal_id BIGINT NOT NULL,
+    name VARCHAR(50) NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS animal_change_version (
+    id TINYINT NOT NULL PRIMARY KEY,
+    version BIGINT UNSIGNED NOT NULL
+);
+
+INSERT IGNORE INTO animal_change_version(id, version) VALUES (1, 0);
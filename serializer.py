@@ -0,0 +1,47 @@
+import json
+import settings
+
+# This module turns animals into JSON for the responses, using orjson when it is installed because it encodes tuples of strings and numbers many times faster than the standard library
+# Every function returns bytes so the result can be sent, hashed for an ETag or cached without encoding it again
+
+# Using orjson if it is installed and allowed by the settings, falling back to the standard library otherwise
+orjson = None
+if(settings.json_encoder != "json"):
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+# The name of the encoder in use, so it can be reported by the benchmarks
+encoder_name = "orjson" if orjson != None else "json"
+
+# The standard library encoder is created once with compact separators so each call skips building a new encoder
+stdlib_encoder = json.JSONEncoder(separators=(",", ":"), default=str)
+
+# Creating a function that encodes any value as JSON, turning values JSON doesn't support (such as dates) into strings like the old json.dumps(..., default=str) calls did
+def dumps(value):
+    if(orjson != None):
+        return orjson.dumps(value, default=str)
+    return stdlib_encoder.encode(value).encode("utf-8")
+
+# Creating a function that encodes the rows from a cursor as a JSON array of arrays, straight from the row tuples
+def encode_rows(rows):
+    return dumps(rows)
+
+# Creating a function that encodes one batch of a streamed JSON array, without the brackets and with a leading comma if earlier batches were already sent
+def encode_rows_chunk(rows, is_first_chunk):
+    if(len(rows) == 0):
+        return b""
+    # Encoding the whole batch as one array and cutting off its brackets is faster than encoding each row on its own and joining them
+    chunk = dumps(rows)[1:-1]
+    return chunk if is_first_chunk else b"," + chunk
+
+# Creating a function that encodes one batch of rows as newline-delimited JSON, with one row per line
+def encode_ndjson_rows(rows):
+    if(len(rows) == 0):
+        return b""
+    return b"\n".join([dumps(row) for row in rows]) + b"\n"
+
+# Creating a function that encodes change log rows as Server-Sent Events, using each change's version as the event id so a reconnecting client resumes after it
+def encode_change_events(rows):
+    return b"".join([b"id: " + str(row[0]).encode("ascii") + b"\nevent: change\ndata: " + dumps(row) + b"\n\n" for row in rows])
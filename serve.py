@@ -0,0 +1,25 @@
+import os
+import settings
+
+# Creating a function that starts the API in the serving mode chosen in the settings
+def main():
+    bind = f"{settings.bind_host}:{settings.bind_port}"
+    # Serving the async app with uvicorn, which handles many slow clients on each worker without blocking a thread per request
+    if(settings.server_mode == "async"):
+        # The async app talks to MariaDB through aiomysql, so it can't use the other storage backends
+        if(settings.storage_backend != "mariadb"):
+            raise SystemExit(f"The async server mode only supports the mariadb storage backend, not {settings.storage_backend!r}.")
+        import uvicorn
+        uvicorn.run("asgi_app:app", host=settings.bind_host, port=settings.bind_port, workers=settings.server_workers, log_level="debug" if settings.debug else "info")
+    # Serving the flask app with gunicorn, replacing this process so gunicorn receives the signals sent to the server
+    elif(settings.server_mode == "sync"):
+        os.execvp("gunicorn", ["gunicorn", "--workers", str(settings.server_workers), "--threads", str(settings.server_threads), "--bind", bind, "app:app"])
+    # Serving the flask app with its development server
+    elif(settings.server_mode == "dev"):
+        import app
+        app.app.run(host=settings.bind_host, port=settings.bind_port, debug=settings.debug)
+    else:
+        raise SystemExit(f"Unknown server mode {settings.server_mode!r}. Expected dev, sync or async.")
+
+if(__name__ == "__main__"):
+    main()
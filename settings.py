@@ -0,0 +1,126 @@
+import os
+
+# Creating a function that reads an integer setting from the environment and falls back to a default value if it is missing or invalid
+def get_int_setting(name, default):
+    value = os.environ.get(name)
+    # If the setting was not set, use the default value
+    if(value == None or value.strip() == ""):
+        return default
+    # Using a try-except block to catch settings that cannot be converted into an integer
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Invalid integer value for {name}. Using the default value of {default}.")
+        return default
+
+# Creating a function that reads a decimal number setting from the environment and falls back to a default value if it is missing or invalid
+def get_float_setting(name, default):
+    value = os.environ.get(name)
+    # If the setting was not set, use the default value
+    if(value == None or value.strip() == ""):
+        return default
+    # Using a try-except block to catch settings that cannot be converted into a decimal number
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Invalid number value for {name}. Using the default value of {default}.")
+        return default
+
+# Creating a function that reads a true/false setting from the environment and falls back to a default value if it is missing
+def get_bool_setting(name, default):
+    value = os.environ.get(name)
+    # If the setting was not set, use the default value
+    if(value == None or value.strip() == ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# The smallest number of connections the pool keeps open, even when they are idle
+pool_min_size = get_int_setting("ANIMALS_POOL_MIN_SIZE", 1)
+# The largest number of connections the pool is allowed to open at the same time
+pool_max_size = get_int_setting("ANIMALS_POOL_MAX_SIZE", 10)
+# The number of seconds an idle connection can sit in the pool before it is closed
+pool_idle_timeout = get_float_setting("ANIMALS_POOL_IDLE_TIMEOUT", 300.0)
+# The number of seconds a request waits for a free connection before giving up
+pool_borrow_timeout = get_float_setting("ANIMALS_POOL_BORROW_TIMEOUT", 5.0)
+# Whether a connection is pinged before it is handed out to a request
+pool_health_check = get_bool_setting("ANIMALS_POOL_HEALTH_CHECK", True)
+
+# The largest number of animals that a single page of GET /animals can return
+page_max_limit = get_int_setting("ANIMALS_PAGE_MAX_LIMIT", 1000)
+# The number of rows that are fetched from the cursor at a time when GET /animals is streamed
+stream_batch_size = get_int_setting("ANIMALS_STREAM_BATCH_SIZE", 500)
+
+# Whether GET /animals responses are cached in memory between writes
+# Each worker has its own cache, so a cached page is only used while the change log version it was read at is still the latest, which catches the writes of every worker
+cache_enabled = get_bool_setting("ANIMALS_CACHE_ENABLED", True)
+# The number of seconds a cached GET /animals response stays valid
+cache_ttl = get_float_setting("ANIMALS_CACHE_TTL", 30.0)
+# The largest number of different GET /animals responses (one per set of query arguments) kept in the cache
+cache_max_entries = get_int_setting("ANIMALS_CACHE_MAX_ENTRIES", 128)
+
+# The largest number of animals that a single request to /animals/bulk can create, edit or delete
+bulk_max_items = get_int_setting("ANIMALS_BULK_MAX_ITEMS", 1000)
+
+# How serve.py runs the API: "dev" for the flask development server, "sync" for the flask app under gunicorn, or "async" for the ASGI app under uvicorn
+server_mode = os.environ.get("ANIMALS_SERVER_MODE", "dev").strip().lower()
+# The address and port that the server listens on
+bind_host = os.environ.get("ANIMALS_BIND_HOST", "127.0.0.1")
+bind_port = get_int_setting("ANIMALS_BIND_PORT", 5000)
+# The number of worker processes for the sync and async serving modes
+server_workers = get_int_setting("ANIMALS_SERVER_WORKERS", os.cpu_count() or 1)
+# The number of threads in each gunicorn worker for the sync serving mode
+server_threads = get_int_setting("ANIMALS_SERVER_THREADS", 4)
+# Whether the flask debugger and reloader are turned on, which must never be done in production
+debug = get_bool_setting("ANIMALS_DEBUG", False)
+
+# Which JSON encoder builds the responses: "auto" uses orjson when it is installed and the standard library otherwise, "json" always uses the standard library
+json_encoder = os.environ.get("ANIMALS_JSON_ENCODER", "auto").strip().lower()
+
+# Whether single-animal writes are queued and committed together in small batches by a background writer instead of each committing on its own
+group_commit_enabled = get_bool_setting("ANIMALS_GROUP_COMMIT", False)
+# The largest number of writes committed together in one transaction
+group_commit_max_batch = get_int_setting("ANIMALS_GROUP_COMMIT_MAX_BATCH", 100)
+# The number of milliseconds the writer waits for more writes to join a batch after the first one arrives
+group_commit_linger_ms = get_float_setting("ANIMALS_GROUP_COMMIT_LINGER_MS", 2.0)
+# The number of seconds a request waits for its queued write before giving up
+# A write still waiting in the queue is dropped and answered with 503, while one whose batch already started may still commit and is answered with 504
+group_commit_timeout = get_float_setting("ANIMALS_GROUP_COMMIT_TIMEOUT", 10.0)
+
+# The shortest and longest animal names that can be stored, counted after the name is normalized
+name_min_length = get_int_setting("ANIMALS_NAME_MIN_LENGTH", 1)
+name_max_length = get_int_setting("ANIMALS_NAME_MAX_LENGTH", 50)
+
+# The number of seconds a new database connection may take before it fails
+connect_timeout = get_int_setting("ANIMALS_CONNECT_TIMEOUT", 5)
+# The number of seconds spent retrying a connection that failed with a temporary error before giving up
+connect_retry_deadline = get_float_setting("ANIMALS_CONNECT_RETRY_DEADLINE", 2.0)
+# The first and the largest delay in seconds between two connection attempts, which doubles after each attempt and is picked at random below that limit
+connect_retry_base_delay = get_float_setting("ANIMALS_CONNECT_RETRY_BASE_DELAY", 0.05)
+connect_retry_max_delay = get_float_setting("ANIMALS_CONNECT_RETRY_MAX_DELAY", 0.5)
+# The number of failed connections in a row that open the circuit breaker, after which requests fail right away instead of waiting on the database
+breaker_failure_threshold = get_int_setting("ANIMALS_BREAKER_FAILURE_THRESHOLD", 5)
+# The number of seconds the circuit breaker stays open before it lets one request try the database again
+breaker_reset_timeout = get_float_setting("ANIMALS_BREAKER_RESET_TIMEOUT", 10.0)
+
+# The read replicas that GET requests are spread across, as a comma-separated list of host:port addresses that use the same credentials as the primary
+# Leaving it empty sends every read to the primary
+replica_hosts = [address.strip() for address in os.environ.get("ANIMALS_REPLICA_HOSTS", "").split(",") if address.strip() != ""]
+# The number of failed reads in a row, whether the connection or the query failed, that eject a replica from the reads, and the number of seconds before one read tries it again
+replica_failure_threshold = get_int_setting("ANIMALS_REPLICA_FAILURE_THRESHOLD", 1)
+replica_eject_seconds = get_float_setting("ANIMALS_REPLICA_EJECT_SECONDS", 30.0)
+# The number of seconds after a write during which the same client reads from the primary, so it sees its own write even if the replicas lag behind
+read_your_writes_seconds = get_float_setting("ANIMALS_READ_YOUR_WRITES_SECONDS", 5.0)
+
+# Which database stores the animals: "mariadb" for a MariaDB server with the credentials in dbcreds, or "sqlite" for an embedded SQLite database
+storage_backend = os.environ.get("ANIMALS_STORAGE_BACKEND", "mariadb").strip().lower()
+# The file of the SQLite database, or ":memory:" for a database that only lives as long as the process
+sqlite_path = os.environ.get("ANIMALS_SQLITE_PATH", "animals.db")
+# The number of seconds a SQLite connection waits for another connection's write to finish before it fails
+sqlite_busy_timeout = get_float_setting("ANIMALS_SQLITE_BUSY_TIMEOUT", 5.0)
+
+# The number of seconds a change stream waits for a change before checking the database again, which also catches writes made by other worker processes
+change_stream_poll_seconds = get_float_setting("ANIMALS_CHANGE_STREAM_POLL_SECONDS", 5.0)
+# The number of seconds a change stream stays open before it ends and the client reconnects from its Last-Event-ID, so a stream never holds a worker thread for good
+change_stream_max_seconds = get_float_setting("ANIMALS_CHANGE_STREAM_MAX_SECONDS", 300.0)
+# The number of milliseconds an EventSource client waits before reconnecting to a change stream that ended
+change_stream_retry_ms = get_int_setting("ANIMALS_CHANGE_STREAM_RETRY_MS", 1000)
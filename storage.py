@@ -0,0 +1,182 @@
+import settings
+import sqlite3
+import threading
+
+# This module holds the storage backends behind dbconnect, so the rest of the API never imports a database driver itself
+# A backend opens connections, creates cursors, checks that a connection still works and supplies the SQL that differs between databases
+# It also carries the DB-API exception classes of its driver, so the handlers catch storage.backend.IntegrityError and the like whichever database is in use
+#   mariadb   a MariaDB server, reached with the credentials in dbcreds
+#   sqlite    an embedded SQLite file in WAL mode, or an in-memory database if the path is ":memory:", for small deployments and for running the API offline
+
+# The DB-API exception classes that every backend takes from its driver
+error_class_names = ("Error", "DatabaseError", "OperationalError", "ProgrammingError", "IntegrityError", "InternalError")
+
+# Creating a function that copies the exception classes of a driver onto a backend
+def copy_error_classes(backend, driver):
+    for name in error_class_names:
+        setattr(backend, name, getattr(driver, name))
+
+# Creating the MariaDB backend
+class MariaDBBackend:
+    name = "mariadb"
+    # A MariaDB primary can have read replicas, and the pool size is only limited by the settings
+    supports_replicas = True
+    max_connections = None
+    # The conditions used by each kind of search, which rely on the indexes added by migrations/001_animal_name_indexes.sql
+    # An exact name and a name prefix are seeks on the unique index on name, and a full-text search uses the FULLTEXT index on name
+    search_conditions = {
+        "name": "name = ?",
+        "prefix": "name LIKE ? ESCAPE '\\\\'",
+        "q": "MATCH(name) AGAINST(? IN BOOLEAN MODE)"
+    }
+    # The condition that starts a searched page after the last id the client has seen
+    search_after_id_condition = "id > ?"
+
+    def __init__(self):
+        # Importing the driver and the credentials here so the SQLite backend works without either of them
+        import dbcreds
+        import mariadb
+        self.driver = mariadb
+        self.credentials = dbcreds
+        self.default_port = dbcreds.port
+        copy_error_classes(self, mariadb)
+
+    # Creating a function that connects to the primary from dbcreds, or to a read replica if its host and port are given
+    def connect(self, host=None, port=None):
+        if(host == None):
+            host = self.credentials.host
+        if(port == None):
+            port = self.credentials.port
+        return self.driver.connect(user=self.credentials.user, password=self.credentials.password, host=host, port=port, database=self.credentials.database, connect_timeout=settings.connect_timeout)
+
+    # Creating a function that returns a cursor that runs its statement as a server-side prepared statement
+    def create_statement_cursor(self, conn):
+        return conn.cursor(prepared=True)
+
+    # Creating a function that returns a cursor that reads its rows from the server as they are fetched
+    # The cursors of the MariaDB connector are buffered by default, which reads every row of the result into memory when the statement is executed
+    # Nothing else can be run on the connection until every row is read or the cursor is closed
+    def create_streaming_cursor(self, conn):
+        return conn.cursor(buffered=False)
+
+    # Creating a function that raises an error if the connection no longer works
+    def ping(self, conn):
+        conn.ping()
+
+    # Creating a function that turns the words of a search into a boolean mode full-text query where every word must match the start of a word in the name
+    def make_fulltext_query(self, words):
+        return " ".join("+" + word + "*" for word in words)
+
+# The schema of the SQLite backend, which is created when it first connects since there is no server to run the migrations on
+# The name uses the NOCASE collation so that names are unique and searched without regard to case, like the default MariaDB collation
+# The full-text search uses an FTS5 table that triggers keep in step with the animal table
+# The change log is the same as the one added by migrations/002_animal_change_log.sql
+sqlite_schema = """
+CREATE TABLE IF NOT EXISTS animal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(50) NOT NULL COLLATE NOCASE UNIQUE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS animal_fts USING fts5(name, content='animal', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS animal_fts_insert AFTER INSERT ON animal BEGIN
+    INSERT INTO animal_fts(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS animal_fts_delete AFTER DELETE ON animal BEGIN
+    INSERT INTO animal_fts(animal_fts, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS animal_fts_update AFTER UPDATE OF name ON animal BEGIN
+    INSERT INTO animal_fts(animal_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    INSERT INTO animal_fts(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TABLE IF NOT EXISTS animal_change (
+    version INTEGER NOT NULL PRIMARY KEY,
+    operation VARCHAR(6) NOT NULL,
+    animal_id INTEGER NOT NULL,
+    name VARCHAR(50) NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS animal_change_version (
+    id INTEGER NOT NULL PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO animal_change_version(id, version) VALUES (1, 0);
+"""
+
+# The URI of the in-memory database, which every connection of this process shares
+sqlite_memory_uri = "file:animals?mode=memory&cache=shared"
+
+# Creating a connection class for SQLite, because the built-in one can't be a key of the weak dictionary that animaldb keeps its statement cursors in
+class SQLiteConnection(sqlite3.Connection):
+    pass
+
+# Creating the embedded SQLite backend
+class SQLiteBackend:
+    name = "sqlite"
+    # An embedded database has no replicas to read from
+    supports_replicas = False
+    # The conditions used by each kind of search
+    # An exact name and a name prefix are seeks on the unique index on name, and a full-text search looks the ids up in the FTS5 table
+    search_conditions = {
+        "name": "name = ?",
+        "prefix": "name LIKE ? ESCAPE '\\'",
+        "q": "id IN (SELECT rowid FROM animal_fts WHERE animal_fts MATCH ?)"
+    }
+    # The condition that starts a searched page after the last id the client has seen
+    # The + stops SQLite from using the primary key for it, since without statistics it would otherwise read the ids in order instead of seeking on the search
+    search_after_id_condition = "+id > ?"
+
+    def __init__(self, path):
+        copy_error_classes(self, sqlite3)
+        self.path = path
+        self.is_memory = path == ":memory:"
+        self.is_schema_created = False
+        self.schema_lock = threading.Lock()
+        # Connections to a shared in-memory database lock whole tables instead of waiting for each other, so the pool keeps to one connection
+        self.max_connections = 1 if self.is_memory else None
+        # Keeping one connection open for as long as the process runs, because an in-memory database is deleted when its last connection closes
+        self.memory_anchor = self.connect() if self.is_memory else None
+
+    # Creating a function that opens a connection to the database file, creating the schema the first time
+    # The host and port of a read replica are not used, since there are none
+    def connect(self, host=None, port=None):
+        if(self.is_memory):
+            conn = sqlite3.connect(sqlite_memory_uri, uri=True, timeout=settings.sqlite_busy_timeout, check_same_thread=False, factory=SQLiteConnection)
+        else:
+            # The pool hands each connection to one thread at a time, but not always the same thread
+            conn = sqlite3.connect(self.path, timeout=settings.sqlite_busy_timeout, check_same_thread=False, factory=SQLiteConnection)
+            # Write-ahead logging lets reads go on while a write is being committed, and only syncing at checkpoints keeps commits fast without risking corruption
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        with self.schema_lock:
+            if(not self.is_schema_created):
+                conn.executescript(sqlite_schema)
+                self.is_schema_created = True
+        return conn
+
+    # Creating a function that returns a cursor for a statement that is run many times
+    # SQLite keeps its own cache of prepared statements on each connection, so a plain cursor already reuses the prepared statement
+    def create_statement_cursor(self, conn):
+        return conn.cursor()
+
+    # Creating a function that returns a cursor that reads its rows as they are fetched
+    # SQLite already steps through the result one row at a time, so a plain cursor streams
+    def create_streaming_cursor(self, conn):
+        return conn.cursor()
+
+    # Creating a function that raises an error if the connection no longer works
+    def ping(self, conn):
+        conn.execute("SELECT 1")
+
+    # Creating a function that turns the words of a search into an FTS5 query where every word must match the start of a word in the name
+    def make_fulltext_query(self, words):
+        return " ".join('"' + word + '"*' for word in words)
+
+# Creating a function that creates the backend with the given name
+def create_backend(name):
+    if(name == "mariadb"):
+        return MariaDBBackend()
+    if(name == "sqlite"):
+        return SQLiteBackend(settings.sqlite_path)
+    raise ValueError(f"Unknown storage backend {name!r}. Expected mariadb or sqlite.")
+
+# The backend chosen in the settings, which every module talks to the database through
+backend = create_backend(settings.storage_backend)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The tests run against the embedded SQLite backend so they need neither a MariaDB server nor dbcreds
+os.environ.setdefault("ANIMALS_STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("ANIMALS_SQLITE_PATH", ":memory:")
+
+# The modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import app
+import dbconnect
+
+# Creating a connect function that fails on purpose and counts how many times it was called
+def make_failing_connect():
+    calls = []
+    def connect():
+        calls.append(time.monotonic())
+        raise sqlite3.OperationalError("the stand-in database is down")
+    return connect, calls
+
+# Creating a function that fails enough calls in a row to open the breaker
+def open_breaker(breaker):
+    connect, calls = make_failing_connect()
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(dbconnect.DatabaseUnavailableError):
+            dbconnect.connect_through_breaker(breaker, connect, retry_deadline=0)
+
+def test_breaker_opens_after_the_failure_threshold():
+    breaker = dbconnect.CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+    connect, calls = make_failing_connect()
+    for attempt in range(3):
+        assert not breaker.is_open()
+        with pytest.raises(dbconnect.DatabaseUnavailableError):
+            dbconnect.connect_through_breaker(breaker, connect, retry_deadline=0)
+    assert breaker.is_open()
+    assert len(calls) == 3
+    breaker_stats = breaker.stats()
+    assert breaker_stats["state"] == 2
+    assert breaker_stats["opened"] == 1
+    assert breaker_stats["failures"] == 3
+
+def test_open_breaker_fails_fast_with_retry_after():
+    breaker = dbconnect.CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+    open_breaker(breaker)
+    connect, calls = make_failing_connect()
+    started_at = time.monotonic()
+    with pytest.raises(dbconnect.DatabaseUnavailableError) as error_info:
+        dbconnect.connect_through_breaker(breaker, connect)
+    # The open breaker answers without calling connect or waiting for the retries
+    assert len(calls) == 0
+    assert time.monotonic() - started_at < 0.1
+    assert 29.0 < error_info.value.retry_after <= 30.0
+    assert breaker.stats()["rejected"] == 1
+
+def test_success_closes_the_breaker_and_resets_the_failures():
+    breaker = dbconnect.CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+    connect, calls = make_failing_connect()
+    for attempt in range(2):
+        with pytest.raises(dbconnect.DatabaseUnavailableError):
+            dbconnect.connect_through_breaker(breaker, connect, retry_deadline=0)
+    conn = dbconnect.connect_through_breaker(breaker, lambda: "connection", retry_deadline=0)
+    assert conn == "connection"
+    assert breaker.stats()["consecutive_failures"] == 0
+    assert breaker.stats()["state"] == 0
+
+def test_half_open_breaker_lets_a_single_trial_call_through():
+    breaker = dbconnect.CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    open_breaker(breaker)
+    time.sleep(0.06)
+    trial_started = threading.Event()
+    finish_trial = threading.Event()
+    trial_calls = []
+
+    # Creating a connect function that holds the trial call open until the test lets it finish
+    def slow_connect():
+        trial_calls.append(time.monotonic())
+        trial_started.set()
+        finish_trial.wait(5.0)
+        return "connection"
+
+    results = []
+    trial = threading.Thread(target=lambda: results.append(dbconnect.connect_through_breaker(breaker, slow_connect)))
+    trial.start()
+    assert trial_started.wait(5.0)
+    assert breaker.stats()["state"] == 1
+    # Every other call is turned away while the trial call is running
+    for attempt in range(3):
+        with pytest.raises(dbconnect.DatabaseUnavailableError):
+            dbconnect.connect_through_breaker(breaker, slow_connect)
+    finish_trial.set()
+    trial.join()
+    assert results == ["connection"]
+    assert len(trial_calls) == 1
+    assert breaker.stats()["state"] == 0
+
+def test_failed_trial_call_opens_the_breaker_again():
+    breaker = dbconnect.CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    open_breaker(breaker)
+    time.sleep(0.06)
+    connect, calls = make_failing_connect()
+    # The trial call gets a single attempt even though the retry deadline would allow more
+    with pytest.raises(dbconnect.DatabaseUnavailableError):
+        dbconnect.connect_through_breaker(breaker, connect, retry_deadline=5.0)
+    assert len(calls) == 1
+    assert breaker.is_open()
+    assert breaker.stats()["opened"] == 2
+
+def test_retry_stops_at_the_deadline():
+    connect, calls = make_failing_connect()
+    started_at = time.monotonic()
+    with pytest.raises(sqlite3.OperationalError):
+        dbconnect.retry_with_backoff(connect, deadline=0.2, base_delay=0.01, max_delay=0.05)
+    elapsed = time.monotonic() - started_at
+    assert elapsed < 0.2
+    assert len(calls) > 1
+
+def test_retry_returns_once_the_database_is_back():
+    calls = []
+    def connect():
+        calls.append(time.monotonic())
+        if(len(calls) < 3):
+            raise sqlite3.OperationalError("the stand-in database is starting")
+        return "connection"
+    assert dbconnect.retry_with_backoff(connect, deadline=5.0, base_delay=0.001, max_delay=0.01) == "connection"
+    assert len(calls) == 3
+
+def test_retry_does_not_retry_other_errors():
+    calls = []
+    def connect():
+        calls.append(time.monotonic())
+        raise sqlite3.ProgrammingError("not a temporary failure")
+    with pytest.raises(sqlite3.ProgrammingError):
+        dbconnect.retry_with_backoff(connect, deadline=5.0, base_delay=0.001, max_delay=0.01)
+    assert len(calls) == 1
+
+def test_handler_sends_503_with_retry_after():
+    with app.app.test_request_context():
+        response = app.handle_database_unavailable(dbconnect.DatabaseUnavailableError("The database is down.", retry_after=2.2))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+def test_request_gets_503_while_the_breaker_is_open(monkeypatch):
+    breaker = dbconnect.CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    open_breaker(breaker)
+    connect, calls = make_failing_connect()
+    pool = dbconnect.ConnectionPool(lambda: dbconnect.connect_through_breaker(breaker, connect), min_size=0, max_size=1)
+    monkeypatch.setattr(dbconnect, "get_db_pool", lambda: pool)
+    response = app.app.test_client().get("/animals")
+    assert response.status_code == 503
+    assert 29 <= int(response.headers["Retry-After"]) <= 30
+    assert len(calls) == 0
@@ -0,0 +1,56 @@
+import pytest
+
+import app
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+def test_create_reports_a_case_only_conflict_on_its_own_item(client):
+    assert client.post("/animals", json={"name": "Bulk Cat"}).status_code == 201
+    response = client.post("/animals/bulk", json=[{"name": "bulk cat"}, {"name": "Bulk Emu"}])
+    assert response.status_code == 200
+    results = response.get_json()
+    assert results[0] == {"error": "Unique key constraint failure. The animal already exists in the database."}
+    assert results[1]["name"] == "Bulk Emu"
+
+def test_create_reports_a_case_only_duplicate_in_the_batch(client):
+    response = client.post("/animals/bulk", json=[{"name": "Bulk Dog"}, {"name": "bulk dog"}])
+    assert response.status_code == 200
+    results = response.get_json()
+    assert results[0]["name"] == "Bulk Dog"
+    assert results[1] == {"error": "Duplicate animal name in the batch."}
+
+def test_edit_reports_a_rename_onto_another_animal_in_another_case(client):
+    first_id = client.post("/animals", json={"name": "Bulk Fox"}).get_json()["id"]
+    second_id = client.post("/animals", json={"name": "Bulk Gnu"}).get_json()["id"]
+    response = client.patch("/animals/bulk", json=[{"id": second_id, "name": "BULK FOX"}])
+    assert response.status_code == 200
+    assert response.get_json() == [{"error": "Unique key constraint failure. The animal already exists in the database."}]
+    # Changing only the case of an animal's own name is allowed
+    response = client.patch("/animals/bulk", json=[{"id": first_id, "name": "BULK FOX"}])
+    assert response.get_json() == [{"id": first_id, "name": "BULK FOX"}]
+
+def test_edit_reports_a_case_only_duplicate_in_the_batch(client):
+    first_id = client.post("/animals", json={"name": "Bulk Hen"}).get_json()["id"]
+    second_id = client.post("/animals", json={"name": "Bulk Ibex"}).get_json()["id"]
+    response = client.patch("/animals/bulk", json=[{"id": first_id, "name": "Bulk Jay"}, {"id": second_id, "name": "bulk jay"}])
+    assert response.get_json() == [{"id": first_id, "name": "Bulk Jay"}, {"error": "Duplicate animal id or name in the batch."}]
+
+def test_results_keep_the_order_of_the_items(client):
+    assert client.post("/animals", json={"name": "Bulk Kiwi"}).status_code == 201
+    items = [{"name": "Bulk Lynx"}, {"name": "1nvalid"}, {"name": "Bulk Kiwi"}, {}, {"name": "Bulk Mole"}, {"name": "bulk lynx"}]
+    results = client.post("/animals/bulk", json=items).get_json()
+    assert len(results) == len(items)
+    assert results[0]["name"] == "Bulk Lynx"
+    assert "error" in results[1]
+    assert results[2] == {"error": "Unique key constraint failure. The animal already exists in the database."}
+    assert "error" in results[3]
+    assert results[4]["name"] == "Bulk Mole"
+    assert results[5] == {"error": "Duplicate animal name in the batch."}
+    assert results[0]["id"] < results[4]["id"]
+    # Deleting returns one result per item in the same order too
+    delete_results = client.delete("/animals/bulk", json=[{"id": results[4]["id"]}, {"id": "x"}, {"id": results[0]["id"]}]).get_json()
+    assert delete_results[0] == {"id": results[4]["id"]}
+    assert "error" in delete_results[1]
+    assert delete_results[2] == {"id": results[0]["id"]}
@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+import animaldb
+import app
+import dbconnect
+import settings
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+# Creating a function that returns the change log version that GET /animals reports
+def current_version(client):
+    response = client.get("/animals", query_string={"limit": 1})
+    assert response.status_code == 200
+    return int(response.headers["X-Change-Version"])
+
+# Creating a function that returns every change after a version as (version, operation, id, name) lists
+def changes_since(client, since):
+    response = client.get("/animals/changes", query_string={"since": since})
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_versions_have_no_gaps_and_follow_the_commit_order(client, monkeypatch):
+    since = current_version(client)
+    ferret_id = client.post("/animals", json={"name": "Feed Ferret"}).get_json()["id"]
+    bulk_results = client.post("/animals/bulk", json=[{"name": "Feed Gecko"}, {"name": "Feed Heron"}]).get_json()
+    gecko_id, heron_id = [result["id"] for result in bulk_results]
+    assert client.patch("/animals/bulk", json=[{"id": gecko_id, "name": "Feed Ibis"}]).status_code == 200
+    assert client.delete("/animals", json={"id": ferret_id}).status_code == 200
+    # Writing through the group commit writer from several requests at once, which can share one batch
+    monkeypatch.setattr(settings, "group_commit_enabled", True)
+    names = ["Feed Jackal", "Feed Koala", "Feed Lemur", "Feed Marmot"]
+    statuses = []
+    threads = [threading.Thread(target=lambda name=name: statuses.append(app.app.test_client().post("/animals", json={"name": name}).status_code)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert statuses == [201] * 4
+
+    changes = changes_since(client, since)
+    assert [change[0] for change in changes] == list(range(since + 1, since + 10))
+    assert [change[1:] for change in changes[:5]] == [
+        ["create", ferret_id, "Feed Ferret"],
+        ["create", gecko_id, "Feed Gecko"],
+        ["create", heron_id, "Feed Heron"],
+        ["update", gecko_id, "Feed Ibis"],
+        ["delete", ferret_id, None]
+    ]
+    assert sorted(change[3] for change in changes[5:]) == names
+    assert all(change[1] == "create" for change in changes[5:])
+    # The ids of animals created at the same time follow the order their changes were committed in
+    assert [change[2] for change in changes[5:]] == sorted(change[2] for change in changes[5:])
+    assert current_version(client) == since + 9
+
+def test_rolled_back_write_adds_no_change(client):
+    since = current_version(client)
+    with dbconnect.pooled_db_connection() as conn:
+        with pytest.raises(RuntimeError):
+            with animaldb.write_transaction(conn):
+                animaldb.insert_animal(conn, "Feed Vole")
+                raise RuntimeError("the request failed before committing")
+    # A write the database refuses is rolled back together with its change
+    assert client.post("/animals", json={"name": "Feed Otter"}).status_code == 201
+    assert client.post("/animals", json={"name": "FEED OTTER"}).status_code == 500
+    changes = changes_since(client, since)
+    assert [change[1:] for change in changes] == [["create", changes[0][2], "Feed Otter"]]
+    assert changes[0][0] == since + 1
+    assert client.get("/animals", query_string={"name": "Feed Vole"}).get_json() == []
+
+def test_changes_are_paged_with_since_and_limit(client):
+    since = current_version(client)
+    for name in ("Feed Newt", "Feed Ocelot", "Feed Puffin"):
+        client.post("/animals", json={"name": name})
+    first_page = client.get("/animals/changes", query_string={"since": since, "limit": 2})
+    assert [change[0] for change in first_page.get_json()] == [since + 1, since + 2]
+    assert first_page.headers["X-Next-Since"] == str(since + 2)
+    second_page = client.get("/animals/changes", query_string={"since": since + 2, "limit": 2})
+    assert [change[3] for change in second_page.get_json()] == ["Feed Puffin"]
+    assert second_page.headers["X-Next-Since"] == str(since + 3)
+    # An empty page tells the client to keep asking from the same version
+    empty_page = client.get("/animals/changes", query_string={"since": since + 3})
+    assert empty_page.get_json() == []
+    assert empty_page.headers["X-Next-Since"] == str(since + 3)
+
+def test_invalid_change_arguments_are_refused(client):
+    assert client.get("/animals/changes").status_code == 400
+    assert client.get("/animals/changes", query_string={"since": -1}).status_code == 400
+    assert client.get("/animals/changes", query_string={"since": 0, "limit": 0}).status_code == 400
+    assert client.get("/animals/changes", query_string={"since": 0, "limit": settings.page_max_limit + 1}).status_code == 400
+
+def test_change_stream_resumes_from_the_last_event_id(client, monkeypatch):
+    monkeypatch.setattr(settings, "change_stream_max_seconds", 0.1)
+    monkeypatch.setattr(settings, "change_stream_poll_seconds", 0.05)
+    since = current_version(client)
+    for name in ("Feed Quail", "Feed Raven"):
+        client.post("/animals", json={"name": name})
+    response = client.get("/animals/changes/stream", headers={"Last-Event-ID": str(since + 1)})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    assert body.startswith(f"retry: {settings.change_stream_retry_ms}\n\n")
+    assert f"id: {since + 1}\n" not in body
+    assert f"id: {since + 2}\nevent: change\ndata: [{since + 2},\"create\"," in body
+    assert "Feed Raven" in body
+    assert "Feed Quail" not in body
+
+def test_animal_list_reports_the_change_version(client):
+    since = current_version(client)
+    client.post("/animals", json={"name": "Feed Stoat"})
+    assert current_version(client) == since + 1
+    # The cached page is answered with the version it is still current at
+    assert current_version(client) == since + 1
@@ -0,0 +1,125 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import animaldb
+import app
+import cache
+import changefeed
+import dbconnect
+import group_commit
+import settings
+
+@pytest.fixture
+def writer(monkeypatch):
+    # Using a writer of the test's own that the app also writes through, so every test starts with an empty queue
+    test_writer = group_commit.GroupCommitWriter(max_batch_size=10, linger_seconds=0.1)
+    monkeypatch.setattr(group_commit, "writer", test_writer)
+    monkeypatch.setattr(settings, "group_commit_enabled", True)
+    return test_writer
+
+# Creating a write function that holds its batch open until the test lets it finish
+class SlowWrite:
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        # Keeping the real insert, since a test may put this write in its place
+        self.insert_animal = animaldb.insert_animal
+
+    def __call__(self, conn, animal_name):
+        self.started.set()
+        self.release.wait(5.0)
+        return self.insert_animal(conn, animal_name)
+
+# Creating a function that tells whether an animal with the given name is stored
+def is_stored(animal_name):
+    with dbconnect.pooled_db_connection() as conn:
+        return len(animaldb.select_animals_by_names(conn, [animal_name])) > 0
+
+# Creating a function that runs a function on a thread and keeps what it returned or raised
+def run_in_thread(function, *args):
+    outcome = {}
+    def run():
+        try:
+            outcome["result"] = function(*args)
+        except Exception as error:
+            outcome["error"] = error
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+def test_integrity_error_only_reaches_its_own_request(writer):
+    assert app.app.test_client().post("/animals", json={"name": "Batch Alpha"}).status_code == 201
+    batches_before = writer.stats()["batches"]
+    runs = [run_in_thread(writer.submit, animaldb.insert_animal, name) for name in ("Batch Beta", "BATCH ALPHA", "Batch Gamma")]
+    for thread, outcome in runs:
+        thread.join()
+    # The three writes shared one batch, and only the duplicate failed
+    assert writer.stats()["batches"] - batches_before == 1
+    assert isinstance(runs[1][1]["error"], sqlite3.IntegrityError)
+    assert runs[0][1]["result"][0] == 1
+    assert runs[2][1]["result"][0] == 1
+    assert is_stored("Batch Beta") and is_stored("Batch Gamma")
+
+def test_write_cancelled_in_the_queue_is_never_applied(writer, monkeypatch):
+    monkeypatch.setattr(writer, "linger_seconds", 0)
+    monkeypatch.setattr(settings, "group_commit_timeout", 0.1)
+    slow_write = SlowWrite()
+    thread, outcome = run_in_thread(writer.submit, slow_write, "Batch Delta")
+    assert slow_write.started.wait(5.0)
+    # The writer is busy with the slow batch, so this write is still queued when its caller gives up
+    response = app.app.test_client().post("/animals", json={"name": "Batch Epsilon"})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    slow_write.release.set()
+    thread.join()
+    # Waiting for the writer to take the cancelled write off the queue
+    deadline = time.monotonic() + 5.0
+    while(writer.stats()["queued"] > 0 and time.monotonic() < deadline):
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert outcome["result"][0] == 1
+    assert not is_stored("Batch Epsilon")
+    assert writer.stats()["timeouts"] == 1
+
+def test_write_that_times_out_during_its_batch_gets_504_and_still_commits(writer, monkeypatch):
+    monkeypatch.setattr(writer, "linger_seconds", 0)
+    monkeypatch.setattr(settings, "group_commit_timeout", 0.1)
+    slow_write = SlowWrite()
+    monkeypatch.setattr(animaldb, "insert_animal", slow_write)
+    cache_generation = cache.animals_cache.current_generation()
+    response = app.app.test_client().post("/animals", json={"name": "Batch Zeta"})
+    assert response.status_code == 504
+    assert "may still be applied" in response.get_data(as_text=True)
+    slow_write.release.set()
+    # The batch commits after its caller gave up, and the cache is still cleared once it does
+    deadline = time.monotonic() + 5.0
+    while(cache.animals_cache.current_generation() == cache_generation and time.monotonic() < deadline):
+        time.sleep(0.01)
+    assert cache.animals_cache.current_generation() == cache_generation + 1
+    assert is_stored("Batch Zeta")
+
+def test_submit_raises_write_timeout_error_once_the_batch_started(writer):
+    slow_write = SlowWrite()
+    with pytest.raises(group_commit.WriteTimeoutError):
+        writer.submit(slow_write, "Batch Eta", timeout=0.2)
+    assert slow_write.started.is_set()
+    slow_write.release.set()
+
+def test_each_batch_clears_the_cache_and_wakes_the_streams(writer):
+    cache_generation = cache.animals_cache.current_generation()
+    stream_generation = changefeed.notifier.current_generation()
+    woken = []
+    waiter = threading.Thread(target=lambda: woken.append(changefeed.notifier.wait(stream_generation, 5.0)))
+    waiter.start()
+    runs = [run_in_thread(writer.submit, animaldb.insert_animal, name) for name in ("Batch Iota", "Batch Kappa")]
+    for thread, outcome in runs:
+        thread.join()
+    waiter.join()
+    # Both writes shared one batch, which cleared the cache and woke the streams once
+    assert writer.stats()["batches"] == 1
+    assert cache.animals_cache.current_generation() == cache_generation + 1
+    assert changefeed.notifier.current_generation() == stream_generation + 1
+    assert woken == [True]
@@ -0,0 +1,169 @@
+import gc
+import sqlite3
+import threading
+import time
+import weakref
+
+import pytest
+
+import animaldb
+import dbconnect
+import storage
+
+# Creating a connect function for the pool that opens stand-in SQLite databases and counts how many it opened
+def make_connect():
+    opened = []
+    def connect():
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        opened.append(conn)
+        return conn
+    return connect, opened
+
+def test_borrow_reuses_a_returned_connection():
+    connect, opened = make_connect()
+    pool = dbconnect.ConnectionPool(connect, min_size=0, max_size=2)
+    conn = pool.borrow()
+    pool.give_back(conn)
+    assert pool.borrow() is conn
+    assert len(opened) == 1
+
+def test_pool_never_opens_more_than_max_size_connections():
+    connect, opened = make_connect()
+    pool = dbconnect.ConnectionPool(connect, min_size=0, max_size=3, borrow_timeout=5.0)
+    in_use = []
+    largest_in_use = []
+    lock = threading.Lock()
+
+    def borrow_and_give_back():
+        for _ in range(20):
+            conn = pool.borrow()
+            with lock:
+                in_use.append(conn)
+                largest_in_use.append(len(in_use))
+            time.sleep(0.001)
+            with lock:
+                in_use.remove(conn)
+            pool.give_back(conn)
+
+    threads = [threading.Thread(target=borrow_and_give_back) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(largest_in_use) <= 3
+    assert len(opened) <= 3
+    assert pool.stats()["in_use"] == 0
+
+def test_borrow_times_out_when_every_connection_is_in_use():
+    connect, opened = make_connect()
+    pool = dbconnect.ConnectionPool(connect, min_size=0, max_size=1)
+    pool.borrow()
+    started_at = time.monotonic()
+    with pytest.raises(dbconnect.PoolTimeoutError):
+        pool.borrow(timeout=0.05)
+    assert time.monotonic() - started_at >= 0.05
+    assert pool.stats()["borrow_timeouts"] == 1
+
+def test_waiting_borrow_gets_the_connection_given_back():
+    connect, opened = make_connect()
+    pool = dbconnect.ConnectionPool(connect, min_size=0, max_size=1)
+    conn = pool.borrow()
+    threading.Timer(0.05, pool.give_back, [conn]).start()
+    assert pool.borrow(timeout=2.0) is conn
+
+def test_connection_that_fails_the_health_check_is_replaced():
+    connect, opened = make_connect()
+    pool = dbconnect.ConnectionPool(connect, min_size=0, max_size=1, health_check=True)
+    conn = pool.borrow()
+    pool.give_back(conn)
+    # Closing the stand-in database makes the ping on the next borrow fail
+    conn.close()
+    replacement = pool.borrow()
+    assert replacement is not conn
+    replacement.execute("SELECT 1")
+    pool_stats = pool.stats()
+    assert pool_stats["health_check_failures"] == 1
+    assert pool_stats["created"] == 2
+    assert pool_stats["closed"] == 1
+
+def test_idle_connections_are_evicted_down_to_min_size():
+    connect, opened = make_connect()
+    pool = dbconnect.ConnectionPool(connect, min_size=1, max_size=3, idle_timeout=0.01)
+    connections = [pool.borrow() for _ in range(3)]
+    for conn in connections:
+        pool.give_back(conn)
+    time.sleep(0.02)
+    with pool.condition:
+        pool.evict_idle_connections()
+    pool_stats = pool.stats()
+    assert pool_stats["idle"] == 1
+    assert pool_stats["idle_evictions"] == 2
+    assert pool_stats["closed"] == 2
+
+def test_fill_to_min_size_opens_the_minimum_number_of_connections():
+    connect, opened = make_connect()
+    pool = dbconnect.ConnectionPool(connect, min_size=2, max_size=3)
+    pool.fill_to_min_size()
+    assert len(opened) == 2
+    assert pool.stats()["idle"] == 2
+
+def test_failed_connect_gives_back_its_spot_in_the_pool():
+    def connect():
+        raise sqlite3.OperationalError("the stand-in database is down")
+    pool = dbconnect.ConnectionPool(connect, min_size=0, max_size=1)
+    with pytest.raises(sqlite3.OperationalError):
+        pool.borrow()
+    pool_stats = pool.stats()
+    assert pool_stats["in_use"] == 0
+    assert pool_stats["connect_failures"] == 1
+
+def test_stats_count_borrows_and_returns():
+    connect, opened = make_connect()
+    pool = dbconnect.ConnectionPool(connect, min_size=0, max_size=2)
+    first = pool.borrow()
+    second = pool.borrow()
+    pool.give_back(first)
+    pool.give_back(second, broken=True)
+    assert pool.stats() == {
+        "created": 2,
+        "closed": 1,
+        "borrowed": 2,
+        "returned": 2,
+        "health_check_failures": 0,
+        "idle_evictions": 0,
+        "borrow_timeouts": 0,
+        "connect_failures": 0,
+        "idle": 1,
+        "in_use": 0,
+        "min_size": 0,
+        "max_size": 2
+    }
+
+def test_pool_refuses_sizes_that_do_not_make_sense():
+    connect, opened = make_connect()
+    with pytest.raises(ValueError):
+        dbconnect.ConnectionPool(connect, min_size=3, max_size=2)
+
+def test_closed_connection_lets_go_of_its_statement_cursors():
+    pool = dbconnect.ConnectionPool(storage.backend.connect, min_size=0, max_size=1)
+    conn = pool.borrow()
+    animaldb.select_animal(conn, 1)
+    assert conn in animaldb.statement_cursors
+    pool.give_back(conn, broken=True)
+    assert conn not in animaldb.statement_cursors
+    # Nothing else holds the closed connection, so it is freed
+    conn_ref = weakref.ref(conn)
+    del conn
+    gc.collect()
+    assert conn_ref() == None
+
+def test_evicted_connection_lets_go_of_its_statement_cursors():
+    pool = dbconnect.ConnectionPool(storage.backend.connect, min_size=0, max_size=1, idle_timeout=0.01)
+    conn = pool.borrow()
+    animaldb.select_animal(conn, 1)
+    pool.give_back(conn)
+    assert conn in animaldb.statement_cursors
+    time.sleep(0.02)
+    with pool.condition:
+        pool.evict_idle_connections()
+    assert conn not in animaldb.statement_cursors
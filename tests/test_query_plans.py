@@ -0,0 +1,25 @@
+import sqlite3
+
+import animaldb
+import migrate
+import storage
+
+def test_every_search_uses_an_index():
+    conn = storage.backend.connect()
+    try:
+        assert migrate.check_query_plans(conn) == []
+    finally:
+        conn.close()
+
+def test_search_on_an_unindexed_column_is_reported(monkeypatch):
+    # Using a private database with an extra column that has no index, so the shared test database keeps its schema
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.executescript(storage.sqlite_schema)
+        conn.execute("ALTER TABLE animal ADD COLUMN species VARCHAR(50) NULL")
+        monkeypatch.setitem(animaldb.search_conditions, "name", "species = ?")
+        problems = migrate.check_query_plans(conn)
+    finally:
+        conn.close()
+    assert len(problems) == 1
+    assert problems[0].startswith("The name search reads the whole animal table")
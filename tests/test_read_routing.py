@@ -0,0 +1,193 @@
+import itertools
+import sqlite3
+import time
+
+import pytest
+
+import animaldb
+import app
+import dbconnect
+import settings
+import storage
+
+# The numbers that keep the stand-in databases of each test apart
+database_numbers = itertools.count()
+
+# Creating stand-in databases for the primary and the read replicas, where each one holds a single animal named after its host
+class StandInDatabases:
+    def __init__(self):
+        self.number = next(database_numbers)
+        self.anchors = {}
+        self.down_hosts = set()
+        self.connect_calls = {}
+
+    # Creating a function that creates the database of a host, leaving out the schema to make every query on it fail
+    def add(self, host, animal_name, has_schema=True):
+        conn = self.open(host)
+        if(has_schema):
+            conn.executescript(storage.sqlite_schema)
+            conn.execute("INSERT INTO animal(name) VALUES(?)", [animal_name,])
+            conn.commit()
+        # Keeping one connection open so the in-memory database lives as long as the test
+        self.anchors[host] = conn
+
+    def open(self, host):
+        return sqlite3.connect(f"file:routing{self.number}{host}?mode=memory&cache=shared", uri=True, check_same_thread=False, factory=storage.SQLiteConnection)
+
+    # Creating the connect function that takes the place of the backend's, where no host means the primary
+    def connect(self, host=None, port=None):
+        host = host or "primary"
+        self.connect_calls[host] = self.connect_calls.get(host, 0) + 1
+        if(host in self.down_hosts):
+            raise sqlite3.OperationalError(f"the stand-in database {host} is down")
+        return self.open(host)
+
+    def close(self):
+        for conn in self.anchors.values():
+            conn.close()
+
+@pytest.fixture
+def databases(monkeypatch):
+    monkeypatch.setattr(settings, "replica_failure_threshold", 2)
+    monkeypatch.setattr(settings, "replica_eject_seconds", 0.1)
+    monkeypatch.setattr(settings, "pool_min_size", 0)
+    monkeypatch.setattr(settings, "cache_enabled", False)
+    stand_ins = StandInDatabases()
+    stand_ins.add("primary", "Primary")
+    monkeypatch.setattr(storage.backend, "connect", stand_ins.connect)
+    monkeypatch.setattr(dbconnect, "db_pool", dbconnect.ConnectionPool(dbconnect.connect_to_database, min_size=0, max_size=4))
+    monkeypatch.setattr(dbconnect, "replica_nodes", [])
+
+    # Creating a function that sets up the read replicas of the test
+    def use_replicas(*hosts):
+        monkeypatch.setattr(settings, "replica_hosts", [f"{host}:3306" for host in hosts])
+        nodes = [dbconnect.ReplicaNode(host, 3306) for host in hosts]
+        monkeypatch.setattr(dbconnect, "replica_nodes", nodes)
+        return nodes
+
+    stand_ins.use_replicas = use_replicas
+    yield stand_ins
+    stand_ins.close()
+
+# Creating a function that reads through the read routing and returns the name of the animal, which tells where the read went
+def read_animal_name(use_primary=False):
+    with dbconnect.pooled_read_connection(use_primary) as conn:
+        return animaldb.select_animals(conn, 0)[0][0]
+
+def test_reads_take_turns_between_idle_replicas(databases):
+    databases.add("alpha", "Alpha")
+    databases.add("beta", "Beta")
+    databases.use_replicas("alpha", "beta")
+    names = [read_animal_name() for _ in range(4)]
+    assert set(names) == {"Alpha", "Beta"}
+    assert names[0] != names[1] and names[1] != names[2] and names[2] != names[3]
+
+def test_reads_go_to_the_least_loaded_replica(databases):
+    databases.add("alpha", "Alpha")
+    databases.add("beta", "Beta")
+    databases.use_replicas("alpha", "beta")
+    with dbconnect.pooled_read_connection() as held_conn:
+        held_name = animaldb.select_animals(held_conn, 0)[0][0]
+        names = [read_animal_name() for _ in range(3)]
+    assert held_name in ("Alpha", "Beta")
+    assert set(names) == {"Alpha", "Beta"} - {held_name}
+
+def test_reads_use_the_primary_without_replicas_or_when_asked(databases):
+    assert read_animal_name() == "Primary"
+    databases.add("alpha", "Alpha")
+    databases.use_replicas("alpha")
+    assert read_animal_name(use_primary=True) == "Primary"
+    assert read_animal_name() == "Alpha"
+
+def test_replica_is_ejected_after_failed_connects(databases):
+    databases.add("alpha", "Alpha")
+    databases.down_hosts.add("alpha")
+    node, = databases.use_replicas("alpha")
+    fallbacks_before = dbconnect.get_read_route_stats()["replica_fallbacks"]
+    # Every read falls back to the primary, and the replica is no longer tried once the failure threshold is reached
+    assert [read_animal_name() for _ in range(4)] == ["Primary"] * 4
+    assert databases.connect_calls["alpha"] == 2
+    assert node.breaker.is_open()
+    assert dbconnect.get_read_route_stats()["replica_fallbacks"] - fallbacks_before == 2
+
+def test_ejected_replica_gets_one_trial_read(databases):
+    databases.add("alpha", "Alpha")
+    databases.down_hosts.add("alpha")
+    node, = databases.use_replicas("alpha")
+    read_animal_name()
+    read_animal_name()
+    assert node.breaker.is_open()
+    databases.down_hosts.clear()
+    time.sleep(0.11)
+    with dbconnect.pooled_read_connection() as trial_conn:
+        # The other reads go to the primary while the trial read is running
+        assert read_animal_name() == "Primary"
+        assert animaldb.select_animals(trial_conn, 0)[0][0] == "Alpha"
+    assert node.breaker.stats()["state"] == 0
+    assert read_animal_name() == "Alpha"
+
+def test_failed_trial_read_ejects_the_replica_again(databases):
+    databases.add("alpha", "Alpha")
+    databases.down_hosts.add("alpha")
+    node, = databases.use_replicas("alpha")
+    read_animal_name()
+    read_animal_name()
+    time.sleep(0.11)
+    assert read_animal_name() == "Primary"
+    assert databases.connect_calls["alpha"] == 3
+    assert node.breaker.is_open()
+    assert read_animal_name() == "Primary"
+    assert databases.connect_calls["alpha"] == 3
+
+def test_replica_whose_queries_fail_is_ejected(databases):
+    databases.add("alpha", "Alpha", has_schema=False)
+    node, = databases.use_replicas("alpha")
+    # The handlers catch the query errors themselves, which the routing still has to count
+    for _ in range(2):
+        with dbconnect.pooled_read_connection() as conn:
+            with pytest.raises(sqlite3.OperationalError):
+                animaldb.select_animals(conn, 0)
+    assert node.breaker.is_open()
+    # Each connection whose query failed was closed instead of going back to the pool
+    assert node.pool.stats()["closed"] == 2
+    assert node.pool.stats()["idle"] == 0
+    assert read_animal_name() == "Primary"
+
+def test_query_error_that_reaches_the_routing_is_counted(databases):
+    databases.add("alpha", "Alpha", has_schema=False)
+    node, = databases.use_replicas("alpha")
+    with pytest.raises(sqlite3.OperationalError):
+        read_animal_name()
+    assert node.breaker.stats()["consecutive_failures"] == 1
+    assert node.pool.stats()["closed"] == 1
+
+def test_client_reads_its_own_write_from_the_primary(databases):
+    databases.add("alpha", "Alpha")
+    databases.use_replicas("alpha")
+    writer = app.app.test_client()
+    response = writer.post("/animals", json={"name": "Zebra"})
+    assert response.status_code == 201
+    assert "animals_last_write" in response.headers["Set-Cookie"]
+    # The writer reads from the primary, which has the new animal that the replica doesn't
+    assert [animal[0] for animal in writer.get("/animals").get_json()] == ["Primary", "Zebra"]
+    assert app.app.test_client().get("/animals").get_json() == [["Alpha", 1]]
+
+def test_last_write_header_reads_from_the_primary(databases):
+    databases.add("alpha", "Alpha")
+    databases.use_replicas("alpha")
+    client = app.app.test_client()
+    assert client.get("/animals", headers={"X-Last-Write-At": str(time.time())}).get_json() == [["Primary", 1]]
+    # A write longer ago than read_your_writes_seconds reads from the replica again
+    assert client.get("/animals", headers={"X-Last-Write-At": str(time.time() - settings.read_your_writes_seconds - 1)}).get_json() == [["Alpha", 1]]
+
+def test_replica_metrics_share_one_family_labeled_by_replica(databases):
+    databases.add("alpha", "Alpha")
+    databases.add("beta", "Beta")
+    databases.use_replicas("alpha", "beta")
+    read_animal_name()
+    lines = app.app.test_client().get("/metrics").get_data(as_text=True).splitlines()
+    assert lines.count("# TYPE animals_replica_pool_in_use gauge") == 1
+    assert 'animals_replica_pool_in_use{replica="alpha:3306"} 0' in lines
+    assert 'animals_replica_pool_in_use{replica="beta:3306"} 0' in lines
+    assert 'animals_replica_breaker_state{replica="alpha:3306"} 0' in lines
+    assert not any(line.startswith("animals_replica0") for line in lines)
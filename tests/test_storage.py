@@ -0,0 +1,65 @@
+import pytest
+
+import app
+import dbconnect
+import settings
+import storage
+
+@pytest.fixture
+def file_backend(tmp_path):
+    return storage.SQLiteBackend(str(tmp_path / "animals.db"))
+
+def test_schema_is_created_once(file_backend, monkeypatch):
+    scripts = []
+    original_executescript = storage.SQLiteConnection.executescript
+    def counting_executescript(conn, script):
+        scripts.append(script)
+        return original_executescript(conn, script)
+    monkeypatch.setattr(storage.SQLiteConnection, "executescript", counting_executescript)
+    first_conn = file_backend.connect()
+    first_conn.execute("INSERT INTO animal(name) VALUES(?)", ["Okapi"])
+    first_conn.commit()
+    second_conn = file_backend.connect()
+    assert len(scripts) == 1
+    assert second_conn.execute("SELECT name FROM animal").fetchall() == [("Okapi",)]
+    first_conn.close()
+    second_conn.close()
+
+def test_file_database_uses_write_ahead_logging(file_backend):
+    conn = file_backend.connect()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+    assert file_backend.max_connections == None
+
+def test_case_only_duplicate_name_raises_the_backend_integrity_error(file_backend):
+    conn = file_backend.connect()
+    conn.execute("INSERT INTO animal(name) VALUES(?)", ["Okapi"])
+    with pytest.raises(file_backend.IntegrityError):
+        conn.execute("INSERT INTO animal(name) VALUES(?)", ["OKAPI"])
+    conn.close()
+
+def test_fulltext_search_follows_renames_and_deletes():
+    client = app.app.test_client()
+    # Creating a function that returns the names found by a full-text search
+    def search(words):
+        return [animal[0] for animal in client.get("/animals", query_string={"q": words}).get_json()]
+    animal_id = client.post("/animals", json={"name": "Snow Quokka"}).get_json()["id"]
+    assert search("quokka") == ["Snow Quokka"]
+    assert client.patch("/animals", json={"id": animal_id, "name": "Snow Wombat"}).status_code == 200
+    assert search("quokka") == []
+    assert search("wombat") == ["Snow Wombat"]
+    assert client.delete("/animals", json={"id": animal_id}).status_code == 200
+    assert search("wombat") == []
+    assert search("snow") == []
+
+def test_memory_backend_caps_the_pool_at_one_connection(monkeypatch):
+    assert storage.backend.is_memory
+    assert storage.backend.max_connections == 1
+    monkeypatch.setattr(settings, "pool_max_size", 10)
+    monkeypatch.setattr(dbconnect, "db_pool", None)
+    pool = dbconnect.get_db_pool()
+    assert pool.max_size == 1
+    assert pool.stats()["min_size"] <= 1
+    # Closing the connection this pool opened, since the test database goes back to the pool it had before
+    while(len(pool.idle_connections) > 0):
+        pool.close_connection(pool.idle_connections.pop()[0])
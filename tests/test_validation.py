@@ -0,0 +1,27 @@
+import pytest
+
+import app
+import validation
+
+# The JSON values that are not strings, which must be refused rather than stored as their text such as "None" or "True"
+not_string_names = [None, True, 7, ["Cat"]]
+
+@pytest.mark.parametrize("name", not_string_names)
+def test_validate_name_refuses_values_that_are_not_strings(name):
+    assert validation.validate_name(name) == (None, validation.not_a_string_error)
+
+@pytest.mark.parametrize("name", not_string_names)
+def test_create_refuses_a_name_that_is_not_a_string(name):
+    response = app.app.test_client().post("/animals", json={"name": name})
+    assert response.status_code == 400
+    assert validation.not_a_string_error in response.get_data(as_text=True)
+
+@pytest.mark.parametrize("name", not_string_names)
+def test_edit_refuses_a_name_that_is_not_a_string(name):
+    client = app.app.test_client()
+    response = client.get("/animals", query_string={"name": "Valid Tapir"}).get_json()
+    animal_id = response[0][1] if len(response) > 0 else client.post("/animals", json={"name": "Valid Tapir"}).get_json()["id"]
+    response = client.patch("/animals", json={"id": animal_id, "name": name})
+    assert response.status_code == 400
+    assert validation.not_a_string_error in response.get_data(as_text=True)
+    assert client.get(f"/animals/{animal_id}").get_json()["name"] == "Valid Tapir"
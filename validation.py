@@ -0,0 +1,53 @@
+import re
+import settings
+import unicodedata
+
+# An animal name is made of words of letters, with a single space, hyphen or apostrophe between two words, such as "Polar bear", "Guinea-pig" or "Pere David's deer"
+# The pattern is compiled once when the module is imported and always has to match the whole name, not just a part of it
+valid_name_pattern = re.compile(r"[A-Za-z]+(?:[ '-][A-Za-z]+)*")
+# Any run of whitespace inside a name, which is collapsed into a single space when the name is normalized
+whitespace_pattern = re.compile(r"\s+")
+
+# The messages for each way a name can fail validation
+not_a_string_error = "The animal name must be a string."
+length_error = f"The animal name must be between {settings.name_min_length} and {settings.name_max_length} characters long."
+charset_error = "The animal name can only contain letters, with single spaces, hyphens or apostrophes between words."
+
+# Creating a function that normalizes a name by combining unicode characters into their standard form, trimming it and collapsing the whitespace inside it
+def normalize_name(name):
+    return whitespace_pattern.sub(" ", unicodedata.normalize("NFKC", name)).strip()
+
+# Creating a function that validates a name and returns the normalized name and None, or None and the reason the name is invalid
+def validate_name(name, fullmatch=valid_name_pattern.fullmatch, min_length=settings.name_min_length, max_length=settings.name_max_length):
+    if(not isinstance(name, str)):
+        return None, not_a_string_error
+    # Most names are already plain, tidy ASCII, so they are checked as they are without building a normalized copy
+    if(not (name.isascii() and min_length <= len(name) <= max_length and fullmatch(name))):
+        name = normalize_name(name)
+        if(not (min_length <= len(name) <= max_length)):
+            return None, length_error
+        if(not fullmatch(name)):
+            return None, charset_error
+    return name, None
+
+# Creating a function that validates a whole list of names in one pass and returns the (index, normalized name) pairs of the valid names and the (index, reason) pairs of the invalid ones
+def validate_names(names):
+    valid_names = []
+    errors = []
+    # Binding the functions and limits to local names once so the loop doesn't look them up for every name
+    fullmatch = valid_name_pattern.fullmatch
+    min_length = settings.name_min_length
+    max_length = settings.name_max_length
+    add_valid_name = valid_names.append
+    add_error = errors.append
+    for index, name in enumerate(names):
+        # Accepting plain, tidy ASCII names right here and only calling validate_name for the names that need normalizing or are invalid
+        if(type(name) is str and name.isascii() and min_length <= len(name) <= max_length and fullmatch(name)):
+            add_valid_name((index, name))
+            continue
+        valid_name, error = validate_name(name)
+        if(error == None):
+            add_valid_name((index, valid_name))
+        else:
+            add_error((index, error))
+    return valid_names, errors